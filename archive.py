@@ -0,0 +1,111 @@
+"""
+This file defines the hot/cold archival of the clients table: signed stays
+whose checkout has passed are moved to `clients_archive` in bounded batches,
+so `clients` only holds the guests currently in-house
+
+    python -m signCheckIn.archive [--before YYYY-MM-DD] [--batch-size N]
+"""
+
+import argparse
+import datetime as dt
+import time
+
+from loguru import logger
+
+from . import settings
+from .common import clients_changed
+
+
+def archivable(db, before):
+    """Requête des séjours signés, terminés avant `before` et inactifs"""
+    return (
+        (db.clients.signed == True)  # noqa: E712
+        & (db.clients.checkout < before)
+        & (db.clients.active == False)  # noqa: E712
+    )
+
+
+def archive_batch(db, ids, archived_on):
+    """Déplace les lignes `ids` de clients vers clients_archive, sans commit"""
+    columns = ", ".join(db.clients[name]._rname for name in db.clients.fields)
+    placeholders = ", ".join("?" * len(ids))
+    db.executesql(
+        f"INSERT INTO {db.clients_archive._rname} ({columns}, {db.clients_archive.archived_on._rname})"
+        f" SELECT {columns}, ? FROM {db.clients._rname} WHERE {db.clients._id._rname} IN ({placeholders});",
+        [archived_on.strftime("%Y-%m-%d %H:%M:%S"), *ids],
+    )
+    db.executesql(f"DELETE FROM {db.clients._rname} WHERE {db.clients._id._rname} IN ({placeholders});", list(ids))
+
+
+def archive_clients(db, before=None, batch_size=None, pause=None):
+    """Archive les séjours terminés par lots, un commit par lot; renvoie le nombre de lignes
+
+    Chaque lot est une courte transaction: entre deux lots le verrou
+    d'écriture est libéré (et `pause` secondes laissées aux actions), une
+    insertion de kiosque n'attend donc jamais plus d'un lot. Chaque lot
+    validé fait avancer clients_changed, comme une écriture des actions.
+    """
+    before = before or dt.date.today()
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    pause = settings.ARCHIVE_PAUSE if pause is None else pause
+    query = archivable(db, before)
+    moved = 0
+    while True:
+        ids = [
+            row.id
+            for row in db(query).select(db.clients.id, limitby=(0, batch_size))
+        ]
+        if not ids:
+            break
+        try:
+            archive_batch(db, ids, dt.datetime.now())
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        # the moved rows leave the cached responses (list, search, changes...)
+        clients_changed.notify()
+        moved += len(ids)
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause)
+    logger.info(f"{moved} clients archived (checkout before {before})")
+    return moved
+
+
+def search_archive(db, nom=None, email=None, checkout_from=None, checkout_to=None, after=None, limit=100):
+    """Cherche des séjours archivés, du plus récent au plus ancien (curseur `after` = id)
+
+    Renvoie (lignes, id de la dernière ligne si une page suivante existe).
+    """
+    table = db.clients_archive
+    query = table.id > 0
+    if nom:
+        # prefix match, served by the NOCASE index on nom
+        query &= table.nom.like(nom.replace("%", "").replace("_", "") + "%")
+    if email:
+        query &= table.email == email
+    if checkout_from:
+        query &= table.checkout >= checkout_from
+    if checkout_to:
+        query &= table.checkout <= checkout_to
+    if after:
+        query &= table.id < after
+    rows = db(query).select(orderby=~table.id, limitby=(0, limit + 1))
+    next_id = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_id
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--before", type=dt.date.fromisoformat, help="archive checkouts before this date (default: today)")
+    parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=settings.ARCHIVE_PAUSE)
+    args = parser.parse_args(argv)
+    from .models import db
+
+    archive_clients(db, args.before, args.batch_size, args.pause)
+
+
+if __name__ == "__main__":
+    main()
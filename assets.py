@@ -0,0 +1,220 @@
+"""
+This file defines the static asset pipeline: every file of static/ is copied
+under a name holding a hash of its content, with precompressed .gz/.br
+siblings and a manifest. Templates link to those names through the `asset`
+helper and the assets action serves them with Cache-Control immutable: a
+new content is a new URL, so the kiosks never revalidate an asset
+
+    python -m signCheckIn.assets [--vendor]
+
+--vendor first downloads the pinned Font Awesome CSS (checked against its
+SRI hash) and its webfonts into static/vendor/fontawesome.
+"""
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+import urllib.parse
+import urllib.request
+
+from loguru import logger
+from py4web import URL
+from py4web.core import Fixture
+
+from . import settings
+
+try:
+    import brotli
+except ImportError:  # optional: only .gz siblings are built
+    brotli = None
+
+MANIFEST = "manifest.json"
+COMPRESSIBLE = (".css", ".js", ".svg", ".html", ".json", ".txt", ".ico", ".ttf", ".eot")
+# url() references of a stylesheet, rewritten to the hashed names
+CSS_URLS = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+FONT_TYPES = {".woff2": "font/woff2", ".woff": "font/woff", ".ttf": "font/ttf", ".eot": "application/vnd.ms-fontobject"}
+# encodings of the precompressed siblings, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+FONTAWESOME_VERSION = "5.14.0"
+FONTAWESOME_CSS = f"https://cdnjs.cloudflare.com/ajax/libs/font-awesome/{FONTAWESOME_VERSION}/css/all.min.css"
+FONTAWESOME_SRI = "sha512-1PKOgIY59xJ8Co8+NE6FZ+LOAZKjy+KY8iq0G4B3CyeY6wYHN3yt9PW0XpSriVlkMXe40PTKnXrLnZ9+fkDaog=="
+
+
+def hashed_name(name, content):
+    """Nom `name` avec l'empreinte de `content`: css/no.css -> css/no.1a2b3c4d5e6f.css"""
+    root, ext = posixpath.splitext(name)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def source_names(folder):
+    """Chemins relatifs (séparateur /) des fichiers de `folder`, hors fichiers cachés"""
+    names = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+        for filename in sorted(files):
+            if not filename.startswith("."):
+                names.append(os.path.relpath(os.path.join(root, filename), folder).replace(os.sep, "/"))
+    return names
+
+
+def rewrite_css(name, content, manifest):
+    """Remplace dans la feuille `name` les url() relatives connues par leur nom empreint"""
+    base = posixpath.dirname(name)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(("data:", "http:", "https:", "//", "/", "#")):
+            return match.group(0)
+        path, suffix = re.match(r"([^?#]*)(.*)", url).groups()
+        target = manifest.get(posixpath.normpath(posixpath.join(base, path)))
+        if target is None:
+            return match.group(0)
+        return f"url({quote}{posixpath.relpath(target, base or '.')}{suffix}{quote})"
+
+    return CSS_URLS.sub(replace, content.decode()).encode()
+
+
+def write_file(path, content):
+    """Écrit `content` dans `path` via un fichier temporaire renommé"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".asset-")
+    with os.fdopen(fd, "wb") as temp:
+        temp.write(content)
+    # mkstemp creates the file private to the user running the build
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+
+
+def precompress(path, content):
+    """Écrit les variantes .gz (et .br) de `path`, quand elles sont plus petites"""
+    variants = [(".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(content, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(content):
+            write_file(path + suffix, compressed)
+
+
+def build(source=None, target=None):
+    """Copie les fichiers de `source` sous leur nom empreint dans `target`, renvoie le manifeste
+
+    Les feuilles de style sont traitées en dernier, leurs url() pointant vers
+    les noms empreints des polices et images; leur empreinte tient compte de
+    cette réécriture. Les anciens fichiers sont gardés: une page déjà
+    chargée peut encore les demander.
+    """
+    source = source or settings.STATIC_FOLDER
+    target = target or settings.ASSETS_FOLDER
+    names = source_names(source)
+    manifest = {}
+    for name in sorted(names, key=lambda name: name.endswith(".css")):
+        with open(os.path.join(source, name), "rb") as stream:
+            content = stream.read()
+        if name.endswith(".css"):
+            content = rewrite_css(name, content, manifest)
+        manifest[name] = hashed_name(name, content)
+        path = os.path.join(target, manifest[name])
+        if not os.path.exists(path):
+            write_file(path, content)
+            if name.endswith(COMPRESSIBLE):
+                precompress(path, content)
+    write_file(os.path.join(target, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    logger.info(f"{len(manifest)} assets built in {target}")
+    return manifest
+
+
+def download(url):
+    """Contenu de `url`"""
+    with urllib.request.urlopen(url, timeout=30) as reply:
+        return reply.read()
+
+
+def vendor_fontawesome(source=None):
+    """Télécharge la CSS Font Awesome (vérifiée par son empreinte SRI) et ses polices dans static/vendor"""
+    folder = os.path.join(source or settings.STATIC_FOLDER, "vendor", "fontawesome")
+    css = download(FONTAWESOME_CSS)
+    algorithm, _, expected = FONTAWESOME_SRI.partition("-")
+    if base64.b64encode(hashlib.new(algorithm, css).digest()).decode() != expected:
+        raise ValueError(f"{FONTAWESOME_CSS} does not match its SRI hash")
+    fonts = sorted({
+        re.match(r"[^?#]*", url).group(0)
+        for _, url in CSS_URLS.findall(css.decode())
+        if url.startswith("../webfonts/")
+    })
+    for font in fonts:
+        path = os.path.normpath(os.path.join(folder, "css", font))
+        write_file(path, download(urllib.parse.urljoin(FONTAWESOME_CSS, font)))
+    write_file(os.path.join(folder, "css", "all.min.css"), css)
+    logger.info(f"Font Awesome {FONTAWESOME_VERSION} vendored with {len(fonts)} webfonts")
+
+
+class Assets(Fixture):
+    """Fixture qui donne aux templates le helper `asset(nom)`: l'URL empreinte d'un fichier de static/"""
+
+    def __init__(self, folder):
+        self.folder = os.path.abspath(folder)
+        self.manifest = {}
+        self.load()
+
+    def load(self):
+        """(Re)lit le manifeste du build; sans build, les templates pointent vers static/"""
+        try:
+            with open(os.path.join(self.folder, MANIFEST)) as stream:
+                self.manifest = json.load(stream)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def url(self, name, *default):
+        """URL empreinte de static/`name`; sinon `default` s'il est donné, ou l'URL static/ simple"""
+        if name in self.manifest:
+            return URL("assets", self.manifest[name])
+        return default[0] if default else URL("static", name)
+
+    def on_request(self, context):
+        context["template_inject"]["asset"] = self.url
+
+    def find(self, name, encodings=()):
+        """Fichier à envoyer pour le nom empreint `name`: (chemin, encodage)
+
+        Prend la variante précompressée dans l'ordre br, gzip si elle existe
+        et que l'encodage fait partie de `encodings`. Les fichiers des builds
+        précédents restent servis; ValueError si `name` n'est dans aucun.
+        """
+        path = os.path.normpath(os.path.join(self.folder, *name.split("/")))
+        if not path.startswith(self.folder + os.sep) or name == MANIFEST or not os.path.isfile(path):
+            raise ValueError("Unknown asset")
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings and os.path.isfile(path + suffix):
+                return path + suffix, encoding
+        return path, "identity"
+
+    @staticmethod
+    def content_type(name):
+        """Type MIME d'un asset d'après son extension"""
+        content_type = mimetypes.guess_type(name)[0]
+        content_type = content_type or FONT_TYPES.get(posixpath.splitext(name)[1], "application/octet-stream")
+        if content_type.startswith("text/") or content_type.endswith(("javascript", "json", "svg+xml")):
+            content_type += "; charset=utf-8"
+        return content_type
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vendor", action="store_true", help="download the vendored libraries first")
+    args = parser.parse_args(argv)
+
+    if args.vendor:
+        vendor_fontawesome()
+    build()
+
+
+if __name__ == "__main__":
+    main()
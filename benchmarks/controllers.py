@@ -0,0 +1,188 @@
+"""
+Micro-benchmarks of the controller functions across table sizes
+
+    python -m signCheckIn.benchmarks.controllers --sizes 1000,100000 --output bench.json
+    python -m signCheckIn.benchmarks.controllers --compare bench.json
+
+Each size gets its own SQLite file seeded with a realistic history (most
+stays signed, a few unsigned recent ones, one active client per terminal),
+with the production pragmas and indexes. Controllers are called directly,
+with a mocked request, as in tests/test_controllers.py.
+"""
+
+import argparse
+import datetime as dt
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+from loguru import logger
+from pydal import DAL
+
+from .. import controllers, search, settings
+from ..common import clients_changed, sqlite_pragmas
+from ..models import create_indexes, define_tables
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+SIGNED_RATIO = 0.95
+TERMINALS = ("default", "desk2")
+SEED_BATCH = 10_000
+# common French names: search terms match realistic numbers of stays
+FIRST_NAMES = ("Jean", "Marie", "Pierre", "Anne", "Nathalie", "Philippe", "Isabelle", "Nicolas", "Hélène", "François")
+SURNAMES = (
+    "Martin", "Bernard", "Thomas", "Petit", "Robert", "Richard", "Durand", "Dubois", "Moreau", "Laurent",
+    "Simon", "Michel", "Lefèvre", "Leroy", "Roux", "David", "Bertrand", "Morel", "Fournier", "Girard",
+    "Bonnet", "Dupont", "Lambert", "Fontaine", "Rousseau", "Vincent", "Muller", "Faure", "André", "Mercier",
+)
+
+
+def seed(db, size, rng):
+    """Remplit `clients` avec `size` séjours répartis sur l'année écoulée"""
+    start = dt.datetime.now() - dt.timedelta(days=365)
+    sql = (
+        "INSERT INTO clients (nom, email, telephone, checkin, checkout, cb,"
+        " signed, active, terminal, created_on) VALUES (?,?,?,?,?,?,?,?,?,?);"
+    )
+    for offset in range(0, size, SEED_BATCH):
+        batch = []
+        for i in range(offset, min(offset + SEED_BATCH, size)):
+            created_on = start + dt.timedelta(seconds=i * 365 * 86400 // size)
+            checkin = created_on.date() + dt.timedelta(days=rng.randint(0, 30))
+            signed = i < size * SIGNED_RATIO
+            first_name, surname = rng.choice(FIRST_NAMES), rng.choice(SURNAMES)
+            batch.append((
+                f"{first_name} {surname}", f"{first_name}.{surname}@example{i % 100}.com".lower(), f"06{i:08d}",
+                checkin.isoformat(), (checkin + dt.timedelta(days=rng.randint(1, 7))).isoformat(),
+                "4970 0000 0000 0000", "T" if signed else "F", "F",
+                rng.choice(TERMINALS), created_on.strftime("%Y-%m-%d %H:%M:%S"),
+            ))
+        db._adapter.cursor.executemany(sql, batch)
+    # one active client per terminal, among the most recent rows
+    for terminal in TERMINALS:
+        db(db.clients.terminal == terminal).select(
+            db.clients.id, orderby=~db.clients.id, limitby=(0, 1)
+        ).first().update_record(active=True)
+    db.commit()
+
+
+def timed(func, repeat, setup=None):
+    """Durées (ms) de `repeat` appels de func, setup() exécuté hors chrono"""
+    durations = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - t0) * 1000)
+    return dict(
+        median_ms=statistics.median(durations),
+        p95_ms=sorted(durations)[max(0, int(len(durations) * 0.95) - 1)],
+        mean_ms=statistics.fmean(durations),
+        repeat=repeat,
+    )
+
+
+def run_size(size, repeat, folder):
+    """Chronomètre chaque chemin de contrôleur sur une table de `size` lignes"""
+    db = DAL(
+        f"sqlite://bench_{size}.db",
+        folder=folder,
+        after_connection=sqlite_pragmas(settings.SQLITE_PRAGMAS),
+    )
+    define_tables(db)
+    create_indexes(db)
+    seed(db, size, random.Random(size))
+    client_id = db(db.clients.signed == False).select(  # noqa: E712
+        db.clients.id, limitby=(0, 1)
+    ).first().id
+    payload = dict(nom="Bench", email="bench@example.com", checkin="2024-01-01", checkout="2024-01-03")
+
+    results = {}
+    with patch.object(controllers, "db", db), patch.object(controllers, "read_db", db), \
+            patch.object(controllers, "request") as request:
+        request.json = payload
+        request.query = {}
+        request.headers = {}
+        paths = {
+            "insert": (controllers.insert, None),
+            "modify": (lambda: controllers.modify(client_id), None),
+            "disable_all_other_clients": (
+                lambda: (controllers.disable_all_other_clients(), db.commit()), None
+            ),
+            # a new generation before each call: measures the query, not the cache
+            "active_client": (controllers.active_client, clients_changed.notify),
+            "active_client_cached": (controllers.active_client, None),
+            "list_clients": (controllers.list_clients, clients_changed.notify),
+            "list_clients_cached": (controllers.list_clients, None),
+            # search_rows directly: the search action would answer from the cache
+            "search_name": (lambda: search.search_rows(db, "jean dupon", 20), None),
+            "search_phone": (lambda: search.search_rows(db, "06 00 04 24", 20), None),
+        }
+        for name, (func, setup) in paths.items():
+            func()  # warm-up
+            results[name] = timed(func, repeat, setup)
+    db.close()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Affiche les ratios médiane/baseline, renvoie les régressions au-delà du seuil"""
+    regressions = []
+    for size, paths in results["results"].items():
+        for name, stats in paths.items():
+            base = baseline["results"].get(size, {}).get(name)
+            if not base:
+                continue
+            ratio = stats["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+            flag = "REGRESSION" if ratio > threshold else ""
+            print(f"{size:>9} {name:<28} {base['median_ms']:9.3f} -> {stats['median_ms']:9.3f} ms  x{ratio:5.2f} {flag}")
+            if ratio > threshold:
+                regressions.append((size, name, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="median ratio flagged as regression")
+    args = parser.parse_args(argv)
+    # keep the per-request INFO lines of the controllers out of the timings
+    logger.disable(controllers.__name__)
+
+    results = dict(
+        meta=dict(
+            python=platform.python_version(),
+            platform=platform.platform(),
+            date=dt.datetime.now().isoformat(timespec="seconds"),
+            repeat=args.repeat,
+        ),
+        results={},
+    )
+    with tempfile.TemporaryDirectory() as folder:
+        for size in (int(size) for size in args.sizes.split(",")):
+            results["results"][str(size)] = run_size(size, args.repeat, folder)
+
+    if args.output:
+        with open(args.output, "w") as stream:
+            json.dump(results, stream, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as stream:
+            regressions = compare(results, json.load(stream), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Peak memory and throughput of the CSV export across export sizes
+
+    python -m signCheckIn.benchmarks.export --sizes 1000,100000,1000000
+
+The whole seeded year is exported; the peak of Python allocations
+(tracemalloc) while the body is produced should not grow with the size.
+"""
+
+import argparse
+import datetime as dt
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pydal import DAL
+
+from .. import exporter, settings
+from ..common import sqlite_pragmas
+from ..models import create_indexes, define_tables
+from .controllers import seed
+
+DEFAULT_SIZES = (1_000, 100_000)
+
+
+def run_size(size, folder):
+    """Exporte `size` séjours: durée, octets produits et pic mémoire (KiB)"""
+    db = DAL(
+        f"sqlite://export_{size}.db",
+        folder=folder,
+        after_connection=sqlite_pragmas(settings.SQLITE_PRAGMAS),
+    )
+    define_tables(db)
+    create_indexes(db)
+    seed(db, size, random.Random(size))
+    start, end = dt.date.today() - dt.timedelta(days=400), dt.date.today() + dt.timedelta(days=400)
+    names = [field.name for field in exporter.export_fields(db.clients)]
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    written = sum(len(chunk) for chunk in exporter.csv_chunks(exporter.stays(db, start, end), names))
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.close()
+    return dict(ms=elapsed * 1000, us_per_row=elapsed * 1e6 / size, bytes=written, peak_kib=peak / 1024)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for size in (int(size) for size in args.sizes.split(",")):
+            results[str(size)] = stats = run_size(size, folder)
+            print(f"{size:>9} {stats['ms']:10.1f} ms {stats['peak_kib']:10.0f} KiB peak", file=sys.stderr)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
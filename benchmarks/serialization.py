@@ -0,0 +1,81 @@
+"""
+Per-row cost of serializing `clients` rows to JSON, Row objects vs raw tuples
+
+    python -m signCheckIn.benchmarks.serialization --sizes 10000,100000
+
+`rows` is the former path of the JSON actions (pydal Rows, as_dict, py4web
+dumps); `plain` is serializers.select_plain + json_dumps, timed with orjson
+and with the stdlib fallback.
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+from unittest.mock import patch
+
+from py4web.core import dumps
+from pydal import DAL
+
+from .. import serializers, settings
+from ..common import sqlite_pragmas
+from ..models import create_indexes, define_tables
+from .controllers import seed, timed
+
+DEFAULT_SIZES = (10_000, 100_000)
+
+
+def run_size(size, repeat, folder):
+    """Chronomètre chaque chemin de sérialisation sur `size` lignes, en µs par ligne"""
+    db = DAL(
+        f"sqlite://serialization_{size}.db",
+        folder=folder,
+        after_connection=sqlite_pragmas(settings.SQLITE_PRAGMAS),
+    )
+    define_tables(db)
+    create_indexes(db)
+    seed(db, size, random.Random(size))
+    query = db.clients.id > 0
+    fields = list(db.clients)
+
+    def rows_path():
+        return dumps(dict(data=[row.as_dict() for row in db(query).select(*fields)]))
+
+    def plain_path():
+        return serializers.json_dumps(dict(data=serializers.select_plain(db, query, fields)))
+
+    def stdlib_path():
+        with patch.object(serializers, "orjson", None):
+            return plain_path()
+
+    assert json.loads(rows_path()) == json.loads(plain_path()) == json.loads(stdlib_path())
+    paths = {"rows": rows_path, "plain": plain_path}
+    if serializers.orjson is not None:
+        paths["plain_stdlib"] = stdlib_path
+    results = {}
+    for name, func in paths.items():
+        stats = timed(func, repeat)
+        results[name] = dict(stats, us_per_row=stats["median_ms"] * 1000 / size)
+    db.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for size in (int(size) for size in args.sizes.split(",")):
+            results[str(size)] = run_size(size, args.repeat, folder)
+            for name, stats in results[str(size)].items():
+                print(f"{size:>9} {name:<14} {stats['median_ms']:10.2f} ms {stats['us_per_row']:8.3f} us/row", file=sys.stderr)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
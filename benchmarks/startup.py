@@ -0,0 +1,77 @@
+"""
+Cold-start time of a worker: importing the app in a fresh interpreter
+
+    python -m signCheckIn.benchmarks.startup --rows 100000 --target-ms 800
+
+The database is seeded once, then the app is imported `--repeat` times
+with FAST_START=1 (schema fingerprint matches, no migration) and
+FAST_START=0 (pydal migration checks and data backfills on every boot).
+Exits with status 1 when the fast-start median exceeds `--target-ms`.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP = __package__.rsplit(".", 1)[0]
+APPS_FOLDER = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run_python(code, folder, fast_start):
+    """Exécute `code` dans un nouvel interpréteur sur la base de `folder`, renvoie sa durée (ms)"""
+    env = dict(
+        os.environ,
+        DATABASE_FOLDER=folder,
+        FAST_START="1" if fast_start else "0",
+        PYTHONPATH=os.pathsep.join(filter(None, [APPS_FOLDER, os.environ.get("PYTHONPATH")])),
+    )
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=env, check=True, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - t0) * 1000
+
+
+def measure(rows, repeat, folder):
+    """Médiane et p95 (ms) de l'import de l'app, avec et sans fast start"""
+    run_python(
+        f"import random; from {APP}.models import db; from {APP}.benchmarks.controllers import seed;"
+        f" seed(db, {rows}, random.Random({rows}))",
+        folder,
+        fast_start=True,
+    )
+    results = {}
+    for name, fast_start in (("fast_start", True), ("migrate", False)):
+        durations = [run_python(f"import {APP}", folder, fast_start) for _ in range(repeat)]
+        results[name] = dict(
+            median_ms=statistics.median(durations),
+            p95_ms=sorted(durations)[max(0, int(len(durations) * 0.95) - 1)],
+            repeat=repeat,
+        )
+    # the interpreter and py4web alone: the floor no app change can go below
+    durations = [run_python("import py4web", folder, True) for _ in range(repeat)]
+    results["py4web_import"] = dict(median_ms=statistics.median(durations), repeat=repeat)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--target-ms", type=float, help="fail when the fast-start median exceeds this")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        results = measure(args.rows, args.repeat, folder)
+    json.dump(dict(rows=args.rows, results=results), sys.stdout, indent=2)
+    print()
+    if args.target_ms is not None and results["fast_start"]["median_ms"] > args.target_ms:
+        print(f"fast start median {results['fast_start']['median_ms']:.0f} ms > target {args.target_ms:.0f} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
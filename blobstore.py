@@ -0,0 +1,95 @@
+"""
+This file defines a content-addressed file store: a blob is written once
+under the SHA-256 of its bytes, and the database only keeps that digest
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+DIGEST = re.compile(r"^[0-9a-f]{64}$")
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+# an SVG document: its root element is <svg>, after an optional BOM, XML
+# declaration, comments and doctype (an HTML page holding an <svg> is not one)
+SVG_ROOT = re.compile(
+    rb"(?:\xef\xbb\xbf)?\s*(?:<\?xml[^>]*\?>\s*)?"
+    rb"(?:(?:<!--.*?-->|<!DOCTYPE\s[^>\[]*(?:\[[^\]]*\])?\s*>)\s*)*<svg[\s>/]",
+    re.S,
+)
+# bytes buffered before the type is checked: the PNG magic, or the SVG
+# prolog up to its root element
+SNIFF_BYTES = 1024
+
+
+def image_type(head):
+    """Type MIME d'une signature d'après ses premiers octets (PNG ou SVG), None sinon"""
+    if head.startswith(PNG_MAGIC):
+        return "image/png"
+    if SVG_ROOT.match(head[:SNIFF_BYTES]):
+        return "image/svg+xml"
+    return None
+
+
+class BlobStore:
+    """Fichiers rangés par empreinte SHA-256: `folder/ab/abcdef...`"""
+
+    def __init__(self, folder, chunk_size=64 * 1024):
+        self.folder = folder
+        self.chunk_size = chunk_size
+
+    def path(self, digest):
+        """Chemin du blob `digest`, ValueError si ce n'est pas une empreinte"""
+        if not DIGEST.match(digest or ""):
+            raise ValueError("Invalid digest")
+        return os.path.join(self.folder, digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.isfile(self.path(digest))
+
+    def put(self, stream, length, check=None):
+        """Copie `length` octets de `stream` dans le store par blocs, renvoie l'empreinte
+
+        Le corps n'est jamais entièrement en mémoire: chaque bloc est haché
+        puis écrit dans un fichier temporaire, renommé à la fin sous son
+        empreinte. `check(début)` reçoit les SNIFF_BYTES premiers octets (ou
+        tout le corps s'il est plus court), quelle que soit la taille des
+        lectures, et peut lever ValueError pour refuser le contenu avant que
+        le reste soit lu.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        hasher = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as temp:
+                head = b""
+                checked = check is None
+                remaining = length
+                while remaining > 0:
+                    chunk = stream.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        raise ValueError("Truncated body")
+                    hasher.update(chunk)
+                    temp.write(chunk)
+                    remaining -= len(chunk)
+                    if not checked:
+                        # a short read must not decide on a partial magic
+                        head += chunk[:SNIFF_BYTES - len(head)]
+                        if len(head) >= SNIFF_BYTES or remaining <= 0:
+                            check(head)
+                            checked = True
+                if not checked:
+                    # nothing was read: the check still decides on the empty content
+                    check(head)
+                temp.flush()
+                os.fsync(temp.fileno())
+            digest = hasher.hexdigest()
+            target = self.path(digest)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # same digest, same bytes: replacing an existing blob is harmless
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return digest
@@ -0,0 +1,124 @@
+"""
+This file defines the change feed of the clients table: triggers (see
+models.CHANGES_SCHEMA) append every insert, update, archival and deletion
+to `clients_changes`, whose id is a sequence number that only grows, so a
+consumer syncs with `changes?since=<last seq>` instead of re-reading `list`
+
+    python -m signCheckIn.changes --compact [--days N]
+"""
+
+import argparse
+import datetime as dt
+
+from loguru import logger
+
+from . import settings
+from .common import clients_changed
+from .serializers import select_plain
+
+
+class ChangesExpired(Exception):
+    """Les changements suivant la séquence demandée ont été compactés"""
+
+
+def first_seq(db):
+    """Plus petite séquence encore dans le journal, None s'il est vide"""
+    first = db.clients_changes.id.min()
+    return db(db.clients_changes).select(first).first()[first]
+
+
+def last_seq(db):
+    """Dernière séquence du journal, 0 s'il est vide"""
+    last = db.clients_changes.id.max()
+    return db(db.clients_changes).select(last).first()[last] or 0
+
+
+def read(db, since, limit):
+    """Changements après la séquence `since`: (entrées, séquence suivante, reste-t-il des changements)
+
+    Chaque client n'apparaît qu'une fois par page, à sa dernière séquence,
+    avec son état courant (`data`, None s'il a été supprimé); un client
+    archivé est lu dans clients_archive. ChangesExpired si `since` précède
+    le début du journal compacté: le consommateur doit tout relire.
+    """
+    log = db.clients_changes
+    first = first_seq(db)
+    if first is not None and since < first - 1:
+        raise ChangesExpired(first)
+    rows = select_plain(
+        db, log.id > since, [log.id, log.client_id, log.op, log.changed_on],
+        orderby=log.id, limitby=(0, limit + 1),
+    )
+    more = len(rows) > limit
+    rows = rows[:limit]
+    latest = {row["client_id"]: row for row in rows}
+    entries = sorted(latest.values(), key=lambda row: row["id"])
+
+    found = {}
+    for table in (db.clients, db.clients_archive):
+        missing = [client_id for client_id in latest if client_id not in found]
+        if not missing:
+            break
+        fields = [table[name] for name in db.clients.fields]
+        for row in select_plain(db, table.id.belongs(missing), fields):
+            found[row["id"]] = row
+    data = [
+        dict(seq=entry["id"], id=entry["client_id"], op=entry["op"], changed_on=entry["changed_on"],
+             data=found.get(entry["client_id"]))
+        for entry in entries
+    ]
+    return data, rows[-1]["id"] if rows else since, more
+
+
+def compact(db, before=None, batch_size=None):
+    """Supprime les entrées antérieures à `before` par lots, un commit et une notification par lot; renvoie leur nombre
+
+    La dernière entrée est toujours gardée: le début du journal dit alors
+    jusqu'où il a été compacté, même quand rien n'a changé depuis.
+    """
+    before = before or dt.datetime.now() - dt.timedelta(days=settings.CHANGES_RETENTION_DAYS)
+    batch_size = batch_size or settings.CHANGES_COMPACT_BATCH_SIZE
+    log = db.clients_changes
+    last = last_seq(db)
+    removed = 0
+    while True:
+        ids = [
+            row.id
+            for row in db((log.changed_on < before) & (log.id < last)).select(
+                log.id, orderby=log.id, limitby=(0, batch_size)
+            )
+        ]
+        if not ids:
+            break
+        try:
+            # the whole prefix: the log never has holes a consumer could skip
+            deleted = db(log.id <= ids[-1]).delete()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        # cached `changes` pages may start before the new beginning of the log
+        clients_changed.notify()
+        removed += deleted
+        if len(ids) < batch_size:
+            break
+    logger.info(f"{removed} changes compacted (before {before:%Y-%m-%d %H:%M:%S})")
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--compact", action="store_true", help="delete the changes older than --days")
+    parser.add_argument("--days", type=int, default=settings.CHANGES_RETENTION_DAYS)
+    parser.add_argument("--batch-size", type=int, default=settings.CHANGES_COMPACT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    from .models import db
+
+    if args.compact:
+        compact(db, dt.datetime.now() - dt.timedelta(days=args.days), args.batch_size)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
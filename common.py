@@ -7,6 +7,13 @@ from loguru import logger
 from py4web import DAL, Cache, Field, Flash, Session, Translator, action
 
 from . import settings
+from .assets import Assets
+from .blobstore import BlobStore
+from .events import ChangeNotifier
+from .metrics import Metrics
+from .pooling import PooledDAL
+from .profiling import SQLProfiler
+from .readonly import ReadOnlyDAL
 
 # #######################################################
 # implement custom logger
@@ -31,18 +38,46 @@ setup_logging()
 # #######################################################
 # connect to db
 # #######################################################
-db = DAL(
+def sqlite_pragmas(pragmas):
+    """Hook after_connection qui applique les pragmas SQLite à chaque connexion"""
+    def after_connection(adapter):
+        if adapter.dbengine != "sqlite":
+            return
+        for name, value in pragmas.items():
+            adapter.execute(f"PRAGMA {name}={value};")
+    return after_connection
+
+# PooledDAL: DB_POOL_SIZE also applies to SQLite, whose pooling pydal turns off;
+# the write actions use it as a fixture, which returns their connection to the pool
+db = PooledDAL(
     settings.DB_URI,
     folder=settings.DB_FOLDER,
     pool_size=settings.DB_POOL_SIZE,
     migrate=settings.DB_MIGRATE,
     fake_migrate=settings.DB_FAKE_MIGRATE,
+    after_connection=sqlite_pragmas(settings.SQLITE_PRAGMAS),
+)
+
+# GET actions read through their own pool of read-only connections: with
+# WAL they never wait for the writer's commits
+read_db = ReadOnlyDAL(
+    settings.DB_URI,
+    folder=settings.DB_FOLDER,
+    pool_size=settings.DB_READ_POOL_SIZE,
+    migrate=False,
+    after_connection=sqlite_pragmas(settings.SQLITE_READ_PRAGMAS),
 )
 
 # #######################################################
 # define global objects that may or may not be used by the actions
 # #######################################################
 cache = Cache(size=1000)
+clients_changed = ChangeNotifier(settings.CHANGES_COUNTER_FILE)
+metrics = Metrics()
+sql_profiler = SQLProfiler(db, settings.SLOW_QUERY_MS)
+sql_profiler.install(read_db)
+signatures = BlobStore(settings.SIGNATURES_FOLDER)
+assets = Assets(settings.ASSETS_FOLDER)
 # T = Translator(settings.T_FOLDER)
 
 # #######################################################
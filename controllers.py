@@ -25,9 +25,14 @@ session, db, T, auth, and tempates are examples of Fixtures.
 Warning: Fixtures MUST be declared with @action.uses({fixtures}) else your app will result in undefined behavior
 """
 
-from py4web import URL, abort, redirect, request  # noqa: F401
+from py4web import HTTP, URL, abort, redirect, request, response  # noqa: F401
 from py4web.core import action as real_action
+import datetime as dt
+import math
+import os
 import sys
+import time
+import zlib
 
 def action(*args, **kwargs):
     """To avoid executing actions during pytest collection."""
@@ -36,78 +41,746 @@ def action(*args, **kwargs):
     else:
         return real_action(*args, **kwargs)
 
+def uses(*fixtures):
+    """Same as action.uses, fixtures are not applied under pytest either."""
+    if 'pytest' in sys.modules:
+        return lambda f: f
+    else:
+        return real_action.uses(*fixtures)
+
+action.uses = uses
+
 from .models import db  # noqa: E402
+from .common import assets, cache, clients_changed, metrics, read_db, signatures, sql_profiler  # noqa: E402
+from . import archive, changes, exporter, importer, occupancy, search  # noqa: E402
+from .blobstore import image_type  # noqa: E402
+from . import serializers  # noqa: E402
+from .serializers import json_dumps, plain_rows, select_plain  # noqa: E402
+from . import settings  # noqa: E402
 from loguru import logger  # noqa: E402
 
-def disable_all_other_clients():
-    """Désactive tous les autres clients actifs"""
-    db(db.clients.active).update(active=False)
-    db.commit()
+def terminal_name(name):
+    """Nom du terminal (kiosque) demandé, DEFAULT_TERMINAL si absent"""
+    return name or settings.DEFAULT_TERMINAL
+
+
+def disable_all_other_clients(terminal=None):
+    """Désactive le client actif du terminal, sans valider: l'appelant commit sa transaction
+
+    L'index unique partiel clients_one_active_per_terminal garantit au plus une
+    ligne active par terminal: la mise à jour ne touche qu'une ligne, jamais
+    celles des autres terminaux, quelle que soit la taille de la table.
+    """
+    db(
+        (db.clients.terminal == terminal_name(terminal)) & (db.clients.active == True)  # noqa: E712
+    ).update(active=False)
+
+
+def stored_stay(client_id):
+    """Séjour du client tel que pydal l'a enregistré (dates converties), pour occupancy.record"""
+    return db(db.clients.id == client_id).select(
+        db.clients.checkin, db.clients.checkout, db.clients.signed
+    ).first()
+
 
 @action("insert", method=["POST"])
+@action.uses(metrics, sql_profiler, db)
 def insert():
-    """Insère un nouveau client, l’active et désactive les autres clients actifs"""
+    """Insère un nouveau client, l’active et désactive les autres clients actifs du terminal
+
+    Avec un numéro `reservation`, l'insertion est idempotente: une réservation
+    déjà connue renvoie l'id existant sans rien modifier.
+    """
     data = request.json
-    
-    # Désactiver tous les autres clients
-    disable_all_other_clients()
-    
-    db.clients.insert(
+    terminal = terminal_name(data.get("terminal"))
+    fields = dict(
         nom = data.get("nom", ""),
         email = data.get("email", ""),
         telephone = data.get("telephone", ""),
         checkin = data.get("checkin", ""),
         checkout = data.get("checkout", ""),
         cb = data.get("cb", ""),
-        active = True,
+        terminal = terminal,
         signed = False
     )
-    
-    db.commit()
+    reservation = str(data.get("reservation") or "").strip()
+    if reservation:
+        return insert_reservation(dict(fields, reservation=reservation))
+
+    # Une seule transaction: désactivation de l'ancien client actif + insertion
+    try:
+        disable_all_other_clients(terminal)
+        client_id = db.clients.insert(**fields, active=True)
+        occupancy.record(db, after=stored_stay(client_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    clients_changed.notify()
     logger.info(f"Client {data.get('nom')} inserted and set as active")
     return "Client inserted successfully"
 
+
+def insert_reservation(fields):
+    """Insère et active le client d'une réservation, sauf si elle existe déjà
+
+    Un doublon (le PMS rejoue un POST expiré) s'arrête à l'INSERT ... ON
+    CONFLICT DO NOTHING, résolu par l'index unique clients_reservation, puis
+    à la lecture de l'id existant par ce même index: aucune écriture, le
+    client actif du terminal reste le même.
+    """
+    sql = db.clients._insert(**fields, active=False).rstrip(";")
+    try:
+        returned = db.executesql(
+            sql + " ON CONFLICT (reservation) WHERE reservation IS NOT NULL DO NOTHING RETURNING id;"
+        )
+        if returned:
+            client_id = returned[0][0]
+            disable_all_other_clients(fields["terminal"])
+            db(db.clients.id == client_id).update(active=True)
+            occupancy.record(db, after=stored_stay(client_id))
+        else:
+            client_id = db(db.clients.reservation == fields["reservation"]).select(db.clients.id).first().id
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    if returned:
+        clients_changed.notify()
+        logger.info(f"Client {fields['nom']} inserted for reservation {fields['reservation']} and set as active")
+    else:
+        logger.info(f"Reservation {fields['reservation']} already inserted as client {client_id}")
+    return dict(id=client_id, inserted=bool(returned))
+
 @action("modify/<client_id>", method=["POST"])
+@action.uses(metrics, sql_profiler, db)
 def modify(client_id):
-    """Modifie un client existant, le désactive et désactive les autres clients actifs"""
+    """Modifie un client existant, le désactive et désactive les autres clients actifs de son terminal"""
     data = request.json
 
-    client = db(db.clients.id == client_id).select().first()
+    client = db(db.clients.id == client_id).select(
+        db.clients.terminal, db.clients.checkin, db.clients.checkout, db.clients.signed
+    ).first()
     if not client:
         abort(404, "Client not found")
-    
-    # Désactiver tous les autres clients
-    disable_all_other_clients()
+    terminal = terminal_name(data.get("terminal") or client.terminal)
 
-    db(db.clients.id == client_id).update(
-        nom = data.get("nom", ""),
-        email = data.get("email", ""),
-        telephone = data.get("telephone", ""),
-        checkin = data.get("checkin", ""),
-        checkout = data.get("checkout", ""),
-        cb = data.get("cb", ""),
-        active = False,
-        signed = False
-    )
-    db.commit()
+    # Une seule transaction: mise à jour du client + désactivation des autres
+    try:
+        db(db.clients.id == client_id).update(
+            nom = data.get("nom", ""),
+            email = data.get("email", ""),
+            telephone = data.get("telephone", ""),
+            checkin = data.get("checkin", ""),
+            checkout = data.get("checkout", ""),
+            cb = data.get("cb", ""),
+            terminal = terminal,
+            active = False,
+            signed = False
+        )
+        disable_all_other_clients(terminal)
+        occupancy.record(db, before=client, after=stored_stay(client_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    clients_changed.notify()
     logger.info(f"Client {client_id} modified and set as not active")
     return "Client modified successfully"
 
 
+@action("import", method=["POST"])
+@action.uses(metrics, sql_profiler, db)
+def import_clients():
+    """Importe un lot de réservations (tableau JSON ou fichier CSV `file`)
+
+    `active` (index dans le lot) désigne la ligne qui devient le client actif
+    du terminal `terminal`, auquel toutes les lignes sont rattachées.
+    Les lignes invalides sont ignorées et listées dans `errors`; les autres
+    sont insérées en un seul executemany et un seul commit.
+    """
+    upload = request.files.get("file")
+    rows = importer.read_csv(upload.file) if upload else request.json
+    if not isinstance(rows, list):
+        abort(400, "Expected a JSON array or a CSV file")
+    try:
+        active_index = request.query.get("active")
+        active_index = None if active_index in (None, "") else int(active_index)
+    except ValueError:
+        abort(400, "Invalid active index")
+    terminal = terminal_name(request.query.get("terminal"))
+
+    valid, errors = importer.validate_rows(rows)
+    if active_index is not None and active_index not in {index for index, _ in valid}:
+        active_index = None
+
+    try:
+        if active_index is not None:
+            disable_all_other_clients(terminal)
+        inserted = importer.insert_rows(db, valid, terminal, active_index)
+        occupancy.record_many(db, (values for _, values in valid))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    if inserted:
+        clients_changed.notify()
+    logger.info(f"{inserted} clients imported, {len(errors)} rejected")
+    return dict(inserted=inserted, active=active_index, errors=errors)
+
+
+def check_signature(head):
+    """Refuse un corps qui n'est ni un PNG ni un SVG"""
+    if image_type(head) is None:
+        raise ValueError("Expected a PNG or SVG signature")
+
+
+@action("sign/<client_id>", method=["POST", "PUT"])
+@action.uses(metrics, sql_profiler, db)
+def sign(client_id):
+    """Enregistre la signature du client (PNG ou SVG en corps brut) et le marque signé
+
+    Le corps est lu par blocs depuis wsgi.input vers le store, jamais en entier
+    en mémoire; la ligne ne garde que l'empreinte de l'image.
+    """
+    client = db(db.clients.id == client_id).select(
+        db.clients.checkin, db.clients.checkout, db.clients.signed
+    ).first()
+    if not client:
+        abort(404, "Client not found")
+    try:
+        length = int(request.environ.get("CONTENT_LENGTH") or "")
+    except ValueError:
+        abort(411, "Content-Length required")
+    if length <= 0:
+        abort(400, "Empty signature")
+    if length > settings.SIGNATURE_MAX_BYTES:
+        abort(413, "Signature too large")
+    try:
+        digest = signatures.put(request.environ["wsgi.input"], length, check=check_signature)
+    except ValueError as error:
+        abort(400, str(error))
+
+    # a previous signature stays in the store: a blob may be shared by other
+    # rows (same bytes, archived stays) and it records what was signed before
+    try:
+        db(db.clients.id == client_id).update(signature=digest, signed=True)
+        occupancy.record(db, before=client, after=dict(client.as_dict(), signed=True))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    clients_changed.notify()
+    logger.info(f"Client {client_id} signed")
+    return dict(signature=digest)
+
+
+@action("signatures/<digest>", method=["GET"])
+@action.uses(metrics)
+def signature_file(digest):
+    """Envoie une image de signature du store, cachée indéfiniment par le client
+
+    L'URL contient l'empreinte du contenu: elle ne change jamais de sens,
+    d'où Cache-Control immutable. Le fichier ouvert est rendu tel quel au
+    serveur, qui l'envoie via wsgi.file_wrapper (sendfile) quand il le peut.
+    """
+    try:
+        path = signatures.path(digest)
+        stream = open(path, "rb")
+    except (ValueError, FileNotFoundError):
+        abort(404, "Signature not found")
+    etag = f'"{digest}"'
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    if etag_matches(etag):
+        stream.close()
+        raise HTTP(304)
+    content_type = image_type(stream.read(1024))
+    stream.seek(0)
+    response.headers["Content-Type"] = content_type or "application/octet-stream"
+    response.headers["Content-Length"] = str(os.fstat(stream.fileno()).st_size)
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    # an SVG opened directly must not run scripts, nor run in the app's origin
+    response.headers["Content-Security-Policy"] = "sandbox; default-src 'none'; style-src 'unsafe-inline'"
+    return stream
+
+
+def requested_fields(table):
+    """Champs demandés par `fields=` (liste séparée par des virgules, tous par défaut)
+
+    La projection est faite dans le SELECT: les colonnes non demandées,
+    cb en tête, ne sont ni lues ni envoyées. HTTP 400 pour un champ inconnu.
+    """
+    names = [name.strip() for name in (request.query.get("fields") or "").split(",") if name.strip()]
+    if not names:
+        return list(table)
+    unknown = [name for name in names if name not in table.fields]
+    if unknown:
+        abort(400, f"Unknown fields: {', '.join(unknown)}")
+    return [table[name] for name in dict.fromkeys(names)]
+
+
+def active_client_rows(terminal=None, fields=None):
+    """Renvoie le client actif du terminal sous forme de liste de dicts (tous les champs par défaut)"""
+    return select_plain(
+        read_db,
+        (read_db.clients.terminal == terminal_name(terminal)) & (read_db.clients.active == True),  # noqa: E712
+        fields or list(read_db.clients),
+        orderby=~read_db.clients.created_on,
+    )
+
+
+def active_client_data(terminal, fields, version):
+    """Client actif du terminal à la génération `version`, lu une seule fois par génération
+
+    Entrée de cache commune à active_client et à son long-polling: les
+    kiosques réveillés par un changement partagent la même requête.
+    """
+    return cache.get(
+        f"active_client_data:{terminal}:{','.join(field.name for field in fields)}@{version}",
+        lambda: dict(data=active_client_rows(terminal, fields)),
+        settings.CACHE_EXPIRATION,
+    )
+
+
+MEDIA_TYPES = {"json": "application/json", "msgpack": "application/msgpack"}
+
+
+def cached_json(key, producer):
+    """Renvoie `producer()` sérialisé en JSON, mis en cache jusqu'à la prochaine écriture
+
+    La génération de clients_changed fait partie de la clé: insert/modify la
+    font avancer, et les anciennes entrées sortent du LRU. Cache.get ne lance
+    qu'un producer à la fois par clé, une rafale de kiosques après un
+    changement ne déclenche donc qu'une requête. La clé sert aussi d'ETag:
+    un kiosque déjà à jour reçoit un 304 sans corps.
+
+    La représentation négociée (JSON ou msgpack, lignes ou colonnes,
+    compression) fait aussi partie de la clé: chaque variante est encodée
+    et compressée une seule fois par génération.
+    """
+    media, layout, encoding = representation()
+    key = f"{key}:{media}:{layout}:{encoding}@{clients_changed.version}"
+    etag = f'"{zlib.crc32(key.encode()):08x}"'
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    if etag_matches(etag):
+        # the kiosk already has this version: no select, no JSON encoding
+        raise HTTP(304)
+    body, rows, applied = cache.get(
+        key, lambda: serialize(producer(), media, layout, encoding), settings.CACHE_EXPIRATION
+    )
+    metrics.record_rows(rows)
+    response.headers["Content-Type"] = MEDIA_TYPES[media]
+    if applied != "identity":
+        response.headers["Content-Encoding"] = applied
+    return body
+
+
+def serialize(payload, media="json", layout="rows", encoding="identity"):
+    """Corps de `payload` dans la représentation demandée, nombre de lignes et compression appliquée"""
+    rows = len(payload.get("data", ()))
+    if layout == "columns":
+        payload = dict(payload, data=serializers.columnar(payload["data"]))
+    body = serializers.msgpack_dumps(payload) if media == "msgpack" else json_dumps(payload)
+    body, applied = serializers.compress(body, encoding, settings.COMPRESS_MIN_BYTES)
+    return body, rows, applied
+
+
+def accepts(header, token):
+    """Vrai si l'en-tête Accept ou Accept-Encoding `header` accepte `token` (q=0 le refuse)"""
+    if not isinstance(header, str):
+        return False
+    for item in header.split(","):
+        name, *params = item.split(";")
+        if name.strip().lower() != token:
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def representation():
+    """Variante négociée de la réponse: (media, layout, encoding)
+
+    msgpack si Accept le demande et que le module est installé, JSON sinon;
+    `layout=columns` pour la disposition en colonnes; br (si le module
+    brotli est installé) ou gzip selon Accept-Encoding.
+    """
+    accept = request.headers.get("Accept")
+    wants_msgpack = accepts(accept, "application/msgpack") or accepts(accept, "application/x-msgpack")
+    media = "msgpack" if wants_msgpack and serializers.msgpack is not None else "json"
+    layout = "columns" if request.query.get("layout") == "columns" else "rows"
+    accept_encoding = request.headers.get("Accept-Encoding")
+    if serializers.brotli is not None and accepts(accept_encoding, "br"):
+        encoding = "br"
+    elif accepts(accept_encoding, "gzip"):
+        encoding = "gzip"
+    else:
+        encoding = "identity"
+    return media, layout, encoding
+
+
+def etag_matches(etag):
+    """Vrai si l'en-tête If-None-Match de la requête désigne `etag`"""
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
 @action("active_client", method=["GET"])
+@action.uses(metrics, sql_profiler, read_db)
 def active_client():
-    rows = db(db.clients.active == True).select(orderby=~db.clients.created_on)  # noqa: E712
-    # Convert Rows to plain dicts for JSON serialization
-    rows_list = [r.as_dict() for r in rows]
-    return dict(data=rows_list)
+    terminal = terminal_name(request.query.get("terminal"))
+    fields = requested_fields(read_db.clients)
+    return cached_json(
+        f"active_client:{terminal}:{','.join(field.name for field in fields)}",
+        lambda: active_client_data(terminal, fields, clients_changed.version),
+    )
+
+
+@action("active_client/wait", method=["GET"])
+@action.uses(metrics, sql_profiler, read_db)
+def wait_active_client():
+    """Long-polling: attend un changement de client actif après la version `since`
+
+    Sans `since`, répond immédiatement avec la version courante.
+    Si rien n'a changé avant le timeout, répond sans relire la base.
+    La version est commune à tous les terminaux: un changement sur un autre
+    terminal réveille aussi ce kiosque, qui relit alors son client actif.
+    """
+    terminal = terminal_name(request.query.get("terminal"))
+    fields = requested_fields(read_db.clients)
+    since = request.query.get("since")
+    try:
+        timeout = float(request.query.get("timeout", settings.LONG_POLL_TIMEOUT))
+        if not math.isfinite(timeout):
+            # nan would pass through min() and max() unchanged
+            raise ValueError(timeout)
+        since = None if since is None else int(since)
+    except ValueError:
+        abort(400, "Invalid since or timeout")
+    timeout = min(max(timeout, 0), settings.LONG_POLL_TIMEOUT)
+
+    if since is None:
+        version = clients_changed.version
+    else:
+        version = clients_changed.wait(since, timeout)
+        if version == since:
+            return dict(version=version, changed=False)
+    return dict(version=version, changed=True, **active_client_data(terminal, fields, version))
+
+
+CURSOR_FORMAT = "%Y%m%d%H%M%S"
+
+
+def encode_cursor(row):
+    """Curseur opaque `(created_on, id)` pointant après `row` (dict de select_plain)"""
+    created_on = dt.datetime.fromisoformat(str(row["created_on"]))
+    return f"{created_on:{CURSOR_FORMAT}}-{row['id']}"
+
+
+def decode_cursor(cursor):
+    """Inverse de encode_cursor, HTTP 400 si le curseur est invalide"""
+    try:
+        created_on, client_id = cursor.split("-")
+        return dt.datetime.strptime(created_on, CURSOR_FORMAT), int(client_id)
+    except ValueError:
+        abort(400, "Invalid cursor")
+
+
+def page_size():
+    """Taille de page demandée (`limit`), bornée par LIST_MAX_PAGE_SIZE"""
+    try:
+        limit = int(request.query.get("limit") or settings.LIST_PAGE_SIZE)
+    except ValueError:
+        abort(400, "Invalid limit")
+    return max(1, min(limit, settings.LIST_MAX_PAGE_SIZE))
+
+
+def stream_ndjson(query, orderby, limitby=None, fields=None):
+    """Envoie les lignes en NDJSON au fil du curseur, sans tout charger en mémoire"""
+    fields = fields or list(read_db.clients)
+    sql = read_db(query)._select(*fields, orderby=orderby, limitby=limitby)
+    # dedicated cursor: the adapter's shared cursor may be reused before
+    # the server has finished consuming the generator
+    cursor = read_db._adapter.connection.cursor()
+    cursor.execute(sql)
+
+    def generate():
+        try:
+            while True:
+                chunk = cursor.fetchmany(settings.STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield "".join(json_dumps(row) + "\n" for row in plain_rows(fields, chunk))
+        finally:
+            cursor.close()
+
+    response.headers["Content-Type"] = "application/x-ndjson"
+    return generate()
 
 
 @action("list", method=["GET"])
+@action.uses(metrics, sql_profiler, read_db)
 def list_clients():
-    rows = db(not db.clients.signed).select(orderby=~db.clients.created_on)
-    # Convert Rows to plain dicts for JSON serialization
-    rows_list = [r.as_dict() for r in rows]
-    return dict(data=rows_list)
+    """Liste les clients non signés, du plus récent au plus ancien, par pages
+
+    `after` reprend après le curseur `next` de la page précédente;
+    `format=ndjson` envoie toutes les lignes restantes en flux;
+    `fields=nom,checkin` ne renvoie que ces colonnes.
+    """
+    query = read_db.clients.signed == False  # noqa: E712
+    after = request.query.get("after")
+    if after:
+        created_on, client_id = decode_cursor(after)
+        query &= (read_db.clients.created_on < created_on) | (
+            (read_db.clients.created_on == created_on) & (read_db.clients.id < client_id)
+        )
+    orderby = ~read_db.clients.created_on | ~read_db.clients.id
+    fields = requested_fields(read_db.clients)
+
+    if request.query.get("format") == "ndjson":
+        limitby = (0, page_size()) if request.query.get("limit") else None
+        return stream_ndjson(query, orderby, limitby, fields)
+
+    limit = page_size()
+    names = ",".join(field.name for field in fields)
+    return cached_json(f"list:{after}:{limit}:{names}", lambda: list_page(query, orderby, limit, fields))
+
+
+def list_page(query, orderby, limit, fields=None):
+    """Une page de `list`: les lignes (champs `fields`, tous par défaut) et le curseur de la page suivante"""
+    fields = fields or list(read_db.clients)
+    # the cursor is made of created_on and id, selected even when not requested
+    names = [field.name for field in fields]
+    selected = fields + [read_db.clients[name] for name in ("created_on", "id") if name not in names]
+    # one extra row tells whether a next page exists
+    rows = select_plain(read_db, query, selected, orderby=orderby, limitby=(0, limit + 1))
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    rows = rows[:limit]
+    if len(selected) > len(fields):
+        rows = [{name: row[name] for name in names} for row in rows]
+    return dict(data=rows, next=next_cursor)
+
+
+# columns of the arrivals/departures views
+STAY_FIELDS = ("id", "nom", "telephone", "checkin", "checkout", "signed", "terminal")
+
+
+def date_range():
+    """Bornes incluses `from`/`to` (AAAA-MM-JJ, aujourd'hui par défaut), HTTP 400 si invalides"""
+    try:
+        start = importer.parse_date(request.query.get("from")) or dt.date.today()
+        end = importer.parse_date(request.query.get("to")) or start
+    except ValueError:
+        abort(400, "Invalid date, expected YYYY-MM-DD")
+    if end < start:
+        abort(400, "to is before from")
+    return start, end
+
+
+def stays_between(field, name):
+    """Page des séjours dont `field` (checkin ou checkout) est entre `from` et `to`
+
+    Triés par date puis id; `after` reprend après le `next` de la page
+    précédente. Chaque page est un parcours de l'index (field, id).
+    """
+    start, end = date_range()
+    after = request.query.get("after")
+    limit = page_size()
+    query = (field >= start) & (field <= end)
+    if after:
+        try:
+            day, client_id = after.split("-")
+            day, client_id = dt.datetime.strptime(day, "%Y%m%d").date(), int(client_id)
+        except ValueError:
+            abort(400, "Invalid cursor")
+        query &= (field > day) | ((field == day) & (read_db.clients.id > client_id))
+
+    def page():
+        fields = [read_db.clients[name] for name in STAY_FIELDS]
+        rows = select_plain(read_db, query, fields, orderby=field | read_db.clients.id, limitby=(0, limit + 1))
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = f"{last[field.name].replace('-', '')}-{last['id']}"
+        return dict(data=rows[:limit], next=next_cursor)
+
+    return cached_json(f"{name}:{start}:{end}:{after}:{limit}", page)
+
+
+@action("arrivals", method=["GET"])
+@action.uses(metrics, sql_profiler, read_db)
+def arrivals():
+    """Clients arrivant entre `from` et `to` (aujourd'hui par défaut)"""
+    return stays_between(read_db.clients.checkin, "arrivals")
+
+
+@action("departures", method=["GET"])
+@action.uses(metrics, sql_profiler, read_db)
+def departures():
+    """Clients partant entre `from` et `to` (aujourd'hui par défaut)"""
+    return stays_between(read_db.clients.checkout, "departures")
+
+
+@action("stats", method=["GET"])
+@action.uses(metrics, sql_profiler, read_db)
+def stats():
+    """Statistiques d'occupation jour par jour entre `from` et `to` (aujourd'hui par défaut)
+
+    Lit seulement daily_stats, une ligne par jour demandé.
+    """
+    start, end = date_range()
+    if (end - start).days >= settings.STATS_MAX_DAYS:
+        abort(400, f"Range longer than {settings.STATS_MAX_DAYS} days")
+    return cached_json(f"stats:{start}:{end}", lambda: dict(data=occupancy.read(read_db, start, end)))
+
+
+@action("export", method=["GET"])
+@action.uses(metrics, sql_profiler, read_db)
+def export_stays():
+    """Export CSV des séjours (archivés compris) arrivés entre `from` et `to`, envoyé en flux
+
+    `cb=mask` (défaut) ne garde que les 4 derniers chiffres de la carte,
+    `cb=omit` retire la colonne, `cb=keep` la laisse entière. Le corps est
+    produit au fil des curseurs, sans Content-Length: le serveur l'envoie
+    en chunked, et la mémoire ne dépend pas du nombre de séjours.
+    """
+    start, end = date_range()
+    cb = request.query.get("cb") or "mask"
+    if cb not in exporter.CB_MODES:
+        abort(400, f"cb must be one of {', '.join(exporter.CB_MODES)}")
+    names = [field.name for field in exporter.export_fields(read_db.clients, cb)]
+    response.headers["Content-Type"] = "text/csv; charset=utf-8"
+    response.headers["Content-Disposition"] = f'attachment; filename="sejours-{start}-{end}.csv"'
+    return exporter.csv_chunks(exporter.stays(read_db, start, end, cb), names)
+
+
+@action("changes", method=["GET"])
+@action.uses(metrics, sql_profiler, read_db)
+def changes_feed():
+    """Changements des clients après la séquence `since`, par pages
+
+    Sans `since`, renvoie seulement la séquence courante (point de départ
+    d'un consommateur qui vient de tout lire via `list`). Reprendre avec
+    `since=next` tant que `more` est vrai. HTTP 410 si les changements
+    demandés ont été compactés: le consommateur doit tout relire.
+    """
+    since = request.query.get("since")
+    try:
+        since = None if since in (None, "") else int(since)
+    except ValueError:
+        abort(400, "Invalid since")
+    if since is None:
+        return dict(data=[], next=changes.last_seq(read_db), more=False)
+    limit = page_size()
+
+    def page():
+        try:
+            data, next_seq, more = changes.read(read_db, since, limit)
+        except changes.ChangesExpired as expired:
+            abort(410, f"Changes before {expired.args[0]} were compacted")
+        return dict(data=data, next=next_seq, more=more)
+
+    return cached_json(f"changes:{since}:{limit}", page)
+
+
+@action("search", method=["GET"])
+@action.uses(metrics, sql_profiler, read_db)
+def search_clients():
+    """Cherche un client par nom, email ou téléphone (`q`), séjours archivés compris
+
+    Chaque mot est cherché en préfixe, sans tenir compte des accents ni de la
+    casse; un numéro peut être tapé avec ou sans espaces, points ou +33.
+    """
+    text = request.query.get("q", "")
+    limit = page_size()
+    return cached_json(f"search:{limit}:{text}", lambda: dict(data=search.search_rows(read_db, text, limit)))
+
+
+@action("archive", method=["GET"])
+@action.uses(metrics, sql_profiler, read_db)
+def archived_clients():
+    """Cherche dans les séjours archivés (`nom` préfixe, `email`, `checkout_from`/`checkout_to`)
+
+    Pages du plus récent au plus ancien, `after` reprend après le `next` de la page précédente.
+    """
+    try:
+        checkout_from = importer.parse_date(request.query.get("checkout_from"))
+        checkout_to = importer.parse_date(request.query.get("checkout_to"))
+        after = int(request.query.get("after") or 0) or None
+    except ValueError:
+        abort(400, "Invalid date or cursor")
+    rows, next_id = archive.search_archive(
+        read_db,
+        nom=request.query.get("nom"),
+        email=request.query.get("email"),
+        checkout_from=checkout_from,
+        checkout_to=checkout_to,
+        after=after,
+        limit=page_size(),
+    )
+    return dict(data=[r.as_dict() for r in rows], next=next_id)
+
+
+@action("assets/<name:path>", method=["GET"])
+@action.uses(metrics)
+def asset_file(name):
+    """Envoie un fichier du build des assets (nom empreint), caché indéfiniment par le client
+
+    Le nom change avec le contenu: Cache-Control immutable, aucune
+    revalidation. La variante .br ou .gz précompressée est envoyée au client
+    qui l'accepte, sans compresser à chaque requête.
+    """
+    accept_encoding = request.headers.get("Accept-Encoding")
+    encodings = [encoding for encoding in ("br", "gzip") if accepts(accept_encoding, encoding)]
+    try:
+        path, encoding = assets.find(name, encodings)
+        stream = open(path, "rb")
+    except (ValueError, FileNotFoundError):
+        abort(404, "Asset not found")
+    response.headers["Content-Type"] = assets.content_type(name)
+    response.headers["Content-Length"] = str(os.fstat(stream.fileno()).st_size)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    response.headers["Vary"] = "Accept-Encoding"
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    return stream
+
+
+@action("metrics", method=["GET"])
+def metrics_text():
+    """Métriques des actions au format Prometheus"""
+    response.headers["Content-Type"] = "text/plain; version=0.0.4"
+    return metrics.render()
+
+
+@action("ready", method=["GET"])
+@action.uses(db)
+def ready():
+    """Sonde de disponibilité: durée d'un aller-retour à la base"""
+    t0 = time.perf_counter()
+    try:
+        db.executesql("SELECT 1;")
+    except Exception as error:
+        logger.error(f"Readiness probe failed: {error}")
+        raise HTTP(503, dict(status="unavailable"))
+    return dict(status="ok", db_ms=round((time.perf_counter() - t0) * 1000, 3))
 
 
 """
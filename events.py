@@ -0,0 +1,81 @@
+"""
+This file defines the change notifier used by the long-polling actions
+and by the response cache to know when cached data became stale
+"""
+
+import fcntl
+import os
+import struct
+import threading
+import time
+
+COUNTER = struct.Struct("<Q")
+
+
+class ChangeNotifier:
+    """Compteur de version sur lequel les lecteurs peuvent attendre un changement
+
+    Avec `path`, le compteur est stocké dans un fichier partagé par tous les
+    workers de la machine: une écriture dans un processus est vue par les
+    autres, qui la détectent en relisant le fichier toutes les `poll_interval`
+    secondes pendant une attente.
+    """
+
+    def __init__(self, path=None, poll_interval=0.5):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._version = 0
+        self._condition = threading.Condition()
+
+    @property
+    def version(self):
+        """Version courante (une lecture de 8 octets si le compteur est partagé)"""
+        if self.path is None:
+            return self._version
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return 0
+        try:
+            data = os.pread(fd, COUNTER.size, 0)
+        finally:
+            os.close(fd)
+        return COUNTER.unpack(data)[0] if len(data) == COUNTER.size else 0
+
+    def notify(self):
+        """Incrémente la version et réveille tous les lecteurs en attente"""
+        with self._condition:
+            if self.path is None:
+                self._version += 1
+                version = self._version
+            else:
+                # opened per call: a flock on a descriptor inherited across
+                # a fork would not exclude the sibling workers
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    data = os.pread(fd, COUNTER.size, 0)
+                    if len(data) == COUNTER.size:
+                        version = COUNTER.unpack(data)[0] + 1
+                    else:
+                        # a recreated file restarts from the clock, not from 1,
+                        # so versions (and the ETags built on them) never repeat
+                        version = time.time_ns() // 1000
+                    os.pwrite(fd, COUNTER.pack(version), 0)
+                finally:
+                    os.close(fd)
+            self._condition.notify_all()
+            return version
+
+    def wait(self, since, timeout):
+        """Attend que la version diffère de `since` (ou le timeout) et la renvoie"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                version = self.version
+                remaining = deadline - time.monotonic()
+                if version != since or remaining <= 0:
+                    return version
+                if self.path is not None:
+                    remaining = min(remaining, self.poll_interval)
+                self._condition.wait(remaining)
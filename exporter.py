@@ -0,0 +1,89 @@
+"""
+This file defines the CSV export of stays over a checkin date range (monthly
+tax and police reports): current and archived stays are read through two
+cursors in (checkin, id) index order, merged, and written a few hundred
+rows at a time, so memory does not grow with the size of the export
+"""
+
+import csv
+import heapq
+import io
+import re
+
+from . import settings
+from .serializers import plain_rows
+
+EXPORT_FIELDS = (
+    "id", "nom", "email", "telephone", "checkin", "checkout", "cb",
+    "reservation", "signed", "terminal", "created_on",
+)
+# what becomes of the card number: kept, masked but for its last 4 digits, or left out
+CB_MODES = ("mask", "omit", "keep")
+NOT_DIGITS = re.compile(r"\D")
+
+
+def mask_card(value):
+    """Numéro de carte masqué sauf ses 4 derniers chiffres"""
+    digits = NOT_DIGITS.sub("", value or "")
+    if len(digits) <= 4:
+        return "*" * len(digits)
+    return "*" * (len(digits) - 4) + digits[-4:]
+
+
+def export_fields(table, cb="mask"):
+    """Champs exportés de `table` selon le mode `cb`"""
+    return [table[name] for name in EXPORT_FIELDS if not (cb == "omit" and name == "cb")]
+
+
+def stays(db, start, end, cb="mask", chunk_size=None):
+    """Générateur des séjours (en cours et archivés) arrivés de `start` à `end` inclus, en dicts
+
+    Chaque table est lue par son propre curseur, `chunk_size` lignes par
+    aller-retour, triée par l'index (checkin, id); les deux flux sont
+    fusionnés dans cet ordre sans être chargés.
+    """
+    chunk_size = chunk_size or settings.STREAM_CHUNK_SIZE
+    streams = []
+    for table in (db.clients, db.clients_archive):
+        fields = export_fields(table, cb)
+        sql = db((table.checkin >= start) & (table.checkin <= end))._select(
+            *fields, orderby=table.checkin | table.id
+        )
+        streams.append(rows_of(db, sql, fields, chunk_size))
+    for row in heapq.merge(*streams, key=lambda row: (row["checkin"], row["id"])):
+        if cb == "mask":
+            row["cb"] = mask_card(row["cb"])
+        yield row
+
+
+def rows_of(db, sql, fields, chunk_size):
+    """Lignes de `sql` en dicts, lues par blocs sur un curseur dédié"""
+    cursor = db._adapter.connection.cursor()
+    try:
+        cursor.execute(sql)
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            yield from plain_rows(fields, chunk)
+    finally:
+        cursor.close()
+
+
+def csv_chunks(rows, names, chunk_size=None):
+    """Texte CSV des `rows` (en-tête compris), un morceau tous les `chunk_size` séjours
+
+    Le BOM UTF-8 fait reconnaître l'encodage par Excel; l'import le retire.
+    """
+    chunk_size = chunk_size or settings.STREAM_CHUNK_SIZE
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=names, lineterminator="\r\n")
+    buffer.write("\ufeff")
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,93 @@
+"""
+This file defines the bulk import of reservations (JSON array or CSV export
+of the PMS): one validation pass, then one executemany in one transaction
+"""
+
+import csv
+import datetime as dt
+import io
+
+IMPORT_FIELDS = ("nom", "email", "telephone", "checkin", "checkout", "cb")
+
+
+def read_csv(fileobj):
+    """Lit un export CSV (séparateur , ; ou tabulation) en liste de dicts"""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return [
+        {key.strip().lower(): value for key, value in row.items() if key}
+        for row in csv.DictReader(text, dialect=dialect)
+    ]
+
+
+def parse_date(value):
+    """Date ISO (AAAA-MM-JJ) ou None si vide, ValueError sinon"""
+    if value in (None, ""):
+        return None
+    if isinstance(value, dt.date):
+        return value
+    return dt.date.fromisoformat(str(value).strip())
+
+
+def validate_rows(rows):
+    """Valide les lignes importées
+
+    Renvoie (valides, erreurs): les lignes valides sont des couples
+    (index, valeurs normalisées), les erreurs des dicts {row, errors}.
+    """
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append(dict(row=index, errors={"row": "Expected an object"}))
+            continue
+        row_errors = {}
+        values = {
+            name: "" if row.get(name) is None else str(row.get(name)).strip()
+            for name in IMPORT_FIELDS
+        }
+        if not values["nom"]:
+            row_errors["nom"] = "Required"
+        for name in ("checkin", "checkout"):
+            try:
+                values[name] = parse_date(row.get(name))
+            except ValueError:
+                row_errors[name] = "Invalid date, expected YYYY-MM-DD"
+        if not row_errors and values["checkin"] and values["checkout"]:
+            if values["checkout"] < values["checkin"]:
+                row_errors["checkout"] = "Before checkin"
+        if row_errors:
+            errors.append(dict(row=index, errors=row_errors))
+        else:
+            valid.append((index, values))
+    return valid, errors
+
+
+def insert_rows(db, valid, terminal, active_index=None):
+    """Insère les lignes validées pour `terminal` en un seul executemany, sans commit
+
+    La ligne d'index `active_index` (s'il est fourni) devient le client actif;
+    l'appelant doit avoir désactivé l'ancien client actif dans la même transaction.
+    """
+    table = db.clients
+    columns = list(IMPORT_FIELDS) + ["terminal", "signed", "active", "created_on"]
+    sql = "INSERT INTO %s (%s) VALUES (%s);" % (
+        table._rname,
+        ", ".join(table[name]._rname for name in columns),
+        ", ".join(["?"] * len(columns)),
+    )
+    created_on = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    params = [
+        [
+            value.isoformat() if isinstance(value, dt.date) else value
+            for value in (values[name] for name in IMPORT_FIELDS)
+        ]
+        + [terminal, "F", "T" if index == active_index else "F", created_on]
+        for index, values in valid
+    ]
+    db._adapter.cursor.executemany(sql, params)
+    return len(params)
@@ -0,0 +1,123 @@
+"""
+This file defines the Metrics fixture: per-action latency histograms,
+request/error counts, rows returned and payload bytes, rendered in the
+Prometheus text format by the `metrics` action
+
+All threads record into the same counters under one lock, held for a few
+additions per request: nothing is kept per thread, so thread-per-request
+and greenlet servers do not make the state or the /metrics rendering grow.
+"""
+
+import threading
+import time
+
+from py4web import request
+from py4web.core import Fixture
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "signcheckin"
+
+
+class ActionStats:
+    """Compteurs d'une action"""
+
+    __slots__ = ("buckets", "duration", "count", "errors", "rows", "bytes")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.duration = 0.0
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.bytes = 0
+
+
+class Metrics(Fixture):
+    """Fixture qui mesure chaque action qui l'utilise"""
+
+    def __init__(self):
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def on_request(self, context):
+        Fixture.local_initialize(self)
+        self.local.t0 = time.perf_counter()
+        self.local.rows = None
+
+    def on_success(self, context):
+        self._record(context, error=context.get("status", 200) >= 400)
+
+    def on_error(self, context):
+        self._record(context, error=True)
+
+    def record_rows(self, rows):
+        """Nombre de lignes renvoyées par l'action en cours (si elle est mesurée)"""
+        if self.is_valid():
+            self.local.rows = rows
+
+    def observe(self, name, duration, error=False, rows=0, size=0):
+        """Enregistre une requête de l'action `name`"""
+        index = 0
+        while index < len(BUCKETS) and duration > BUCKETS[index]:
+            index += 1
+        with self._lock:
+            stats = self._totals.get(name)
+            if stats is None:
+                stats = self._totals[name] = ActionStats()
+            stats.buckets[index] += 1
+            stats.duration += duration
+            stats.count += 1
+            stats.errors += error
+            stats.rows += rows
+            stats.bytes += size
+
+    def _record(self, context, error):
+        duration = time.perf_counter() - self.local.t0
+        output = context.get("output")
+        rows = self.local.rows
+        if rows is None and isinstance(output, dict) and isinstance(output.get("data"), list):
+            rows = len(output["data"])
+        if isinstance(output, str):
+            # sent as UTF-8: an accented name takes more than one byte
+            output = output.encode()
+        size = len(output) if isinstance(output, bytes) else 0
+        route = request.environ.get("ombott.route")
+        name = route.rule if route is not None else request.path
+        self.observe(name, duration, error, rows or 0, size)
+
+    def snapshot(self):
+        """Copie cohérente des compteurs: {action: ActionStats}"""
+        totals = {}
+        with self._lock:
+            for name, stats in self._totals.items():
+                total = totals[name] = ActionStats()
+                total.buckets = list(stats.buckets)
+                for attribute in ("duration", "count", "errors", "rows", "bytes"):
+                    setattr(total, attribute, getattr(stats, attribute))
+        return totals
+
+    def render(self):
+        """Métriques au format texte Prometheus"""
+        totals = self.snapshot()
+        lines = [
+            f"# HELP {PREFIX}_request_duration_seconds Action latency.",
+            f"# TYPE {PREFIX}_request_duration_seconds histogram",
+        ]
+        for name, stats in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), stats.buckets):
+                cumulative += count
+                lines.append(f'{PREFIX}_request_duration_seconds_bucket{{action="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{PREFIX}_request_duration_seconds_sum{{action="{name}"}} {stats.duration:.6f}')
+            lines.append(f'{PREFIX}_request_duration_seconds_count{{action="{name}"}} {stats.count}')
+        for metric, attribute, help_text in (
+            ("requests_total", "count", "Requests handled."),
+            ("request_errors_total", "errors", "Requests that failed or returned a 4xx/5xx status."),
+            ("rows_returned_total", "rows", "Rows returned in response payloads."),
+            ("response_bytes_total", "bytes", "Bytes of serialized response payloads."),
+        ):
+            lines.append(f"# HELP {PREFIX}_{metric} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{metric} counter")
+            for name, stats in sorted(totals.items()):
+                lines.append(f'{PREFIX}_{metric}{{action="{name}"}} {getattr(stats, attribute)}')
+        return "\n".join(lines) + "\n"
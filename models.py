@@ -4,24 +4,279 @@ This file defines the database models
 
 from pydal.validators import *  # noqa: F403
 import datetime as dt
+import hashlib
 
-from .common import Field, db
+from . import settings
+from .common import Field, db, read_db
 
 ### Define your table below
 # db.define_table('thing', Field('name'))
 
-db.define_table('clients',
-    Field('nom', 'string'),
-    Field('email', 'string'),
-    Field('telephone', 'string'),
-    Field('checkin', 'date'),
-    Field('checkout', 'date'),
-    Field('cb', 'string'),
-    Field("signed", "boolean", default=False),
-    Field("active", "boolean", default=False),
-    Field('created_on', 'datetime', default=dt.datetime.now()),
+def define_tables(db, migrate=None):
+    """Définit les tables de l'application sur `db` (aussi utilisé par les benchmarks)"""
+    # migrate=None: the DAL default
+    options = {} if migrate is None else dict(migrate=migrate)
+    db.define_table('clients',
+        Field('nom', 'string'),
+        Field('email', 'string'),
+        Field('telephone', 'string'),
+        Field('checkin', 'date'),
+        Field('checkout', 'date'),
+        Field('cb', 'string'),
+        # reservation number in the PMS, unique when set: retried inserts
+        # of the same reservation resolve to the existing client
+        Field("reservation", "string", length=64),
+        Field("signed", "boolean", default=False),
+        # SHA-256 of the signature image in the signatures store, the
+        # bytes themselves stay out of the row
+        Field("signature", "string", length=64),
+        Field("active", "boolean", default=False),
+        # signing kiosk the client is (or was) active on
+        Field("terminal", "string", default=settings.DEFAULT_TERMINAL),
+        # callable default: evaluated for each row, not once at import
+        Field('created_on', 'datetime', default=dt.datetime.now),
+        **options,
+    )
+    # signed stays whose checkout has passed, moved out of `clients` by
+    # archive.archive_clients; rows keep their id
+    db.define_table('clients_archive',
+        db.clients,
+        Field('archived_on', 'datetime'),
+        **options,
+    )
+    # per-day counters maintained by occupancy.record in the write actions'
+    # transactions (arrivals split into signed/unsigned, in-house nights)
+    db.define_table('daily_stats',
+        Field('day', 'date', unique=True),
+        Field('arrivals', 'integer', default=0),
+        Field('departures', 'integer', default=0),
+        Field('signed', 'integer', default=0),
+        Field('unsigned', 'integer', default=0),
+        Field('in_house', 'integer', default=0),
+        **options,
+    )
+    # change feed written by the CHANGES_SCHEMA triggers: the id (SQLite
+    # AUTOINCREMENT, never reused) is the sequence of the changes action
+    db.define_table('clients_changes',
+        Field('client_id', 'integer'),
+        Field('op', 'string', length=8),
+        Field('changed_on', 'datetime'),
+        **options,
+    )
+
+
+# indexes backing the hot filters of the actions (pydal migrations do not
+# manage indexes); partial indexes only hold the few active/unsigned rows
+CLIENTS_INDEXES = {
+    # at most one active client per terminal: activation only ever touches
+    # one row and concurrent workers cannot both leave a client active
+    "clients_one_active_per_terminal": (
+        "CREATE UNIQUE INDEX IF NOT EXISTS clients_one_active_per_terminal"
+        " ON clients (terminal, active) WHERE active = 'T';"
+    ),
+    "clients_reservation": (
+        "CREATE UNIQUE INDEX IF NOT EXISTS clients_reservation"
+        " ON clients (reservation) WHERE reservation IS NOT NULL;"
+    ),
+    "clients_unsigned_created_on": (
+        "CREATE INDEX IF NOT EXISTS clients_unsigned_created_on"
+        " ON clients (signed, created_on, id) WHERE signed = 'F';"
+    ),
+    # arrivals/departures: date range scans, id breaks ties for the pages
+    "clients_checkin": (
+        "CREATE INDEX IF NOT EXISTS clients_checkin ON clients (checkin, id);"
+    ),
+    "clients_checkout": (
+        "CREATE INDEX IF NOT EXISTS clients_checkout ON clients (checkout, id);"
+    ),
+    # rows the archival picks up, without scanning the in-house ones
+    "clients_signed_checkout": (
+        "CREATE INDEX IF NOT EXISTS clients_signed_checkout"
+        " ON clients (signed, checkout, id) WHERE signed = 'T';"
+    ),
+    "clients_archive_checkout": (
+        "CREATE INDEX IF NOT EXISTS clients_archive_checkout"
+        " ON clients_archive (checkout, id);"
+    ),
+    # exports of a checkin range, merged with the clients_checkin scan
+    "clients_archive_checkin": (
+        "CREATE INDEX IF NOT EXISTS clients_archive_checkin"
+        " ON clients_archive (checkin, id);"
+    ),
+    "clients_archive_nom": (
+        "CREATE INDEX IF NOT EXISTS clients_archive_nom"
+        " ON clients_archive (nom COLLATE NOCASE);"
+    ),
+}
+
+# indexes replaced by the ones above, dropped by create_indexes
+OBSOLETE_INDEXES = ("clients_active_created_on", "clients_one_active")
+
+
+def phone_digits(column):
+    """Expression SQL des seuls chiffres de `column`, un +33 étant aussi indexé en 0"""
+    digits = f"coalesce({column}, '')"
+    for separator in " .-+()/":
+        digits = f"replace({digits}, '{separator}', '')"
+    return f"{digits} || CASE WHEN {digits} LIKE '33%' THEN ' 0' || substr({digits}, 3) ELSE '' END"
+
+
+def search_values(row):
+    """Valeurs (rowid, nom, email, telephone) de clients_search pour la ligne `row` (new/old)"""
+    return f"{row}.id, {row}.nom, {row}.email, {phone_digits(f'{row}.telephone')}"
+
+
+# full-text index of the search action over current and archived stays
+# (archived rows keep their id, so rowid = clients.id either way); the
+# unicode61 tokenizer folds case and accents, telephone holds digits only
+SEARCH_SCHEMA = {
+    "clients_search": (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS clients_search USING fts5("
+        "nom, email, telephone, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3');"
+    ),
+    "clients_search_insert": (
+        "CREATE TRIGGER IF NOT EXISTS clients_search_insert AFTER INSERT ON clients BEGIN"
+        f" INSERT INTO clients_search (rowid, nom, email, telephone) VALUES ({search_values('new')});"
+        " END;"
+    ),
+    "clients_search_update": (
+        "CREATE TRIGGER IF NOT EXISTS clients_search_update"
+        " AFTER UPDATE OF nom, email, telephone ON clients BEGIN"
+        " DELETE FROM clients_search WHERE rowid = old.id;"
+        f" INSERT INTO clients_search (rowid, nom, email, telephone) VALUES ({search_values('new')});"
+        " END;"
+    ),
+    # archival moves a row to clients_archive before deleting it: keep it searchable
+    "clients_search_delete": (
+        "CREATE TRIGGER IF NOT EXISTS clients_search_delete AFTER DELETE ON clients"
+        " WHEN NOT EXISTS (SELECT 1 FROM clients_archive WHERE id = old.id) BEGIN"
+        " DELETE FROM clients_search WHERE rowid = old.id;"
+        " END;"
+    ),
+    "clients_archive_search_delete": (
+        "CREATE TRIGGER IF NOT EXISTS clients_archive_search_delete AFTER DELETE ON clients_archive BEGIN"
+        " DELETE FROM clients_search WHERE rowid = old.id;"
+        " END;"
+    ),
+}
+
+
+
+def change_entry(op, row):
+    """INSERT d'une entrée `op` du journal clients_changes pour la ligne `row` (new/old)"""
+    return (
+        "INSERT INTO clients_changes (client_id, op, changed_on)"
+        f" VALUES ({row}.id, '{op}', datetime('now', 'localtime'));"
+    )
+
+
+# change feed of the changes action: every write to clients, whatever its
+# path (actions, import, archival, SQL by hand), appends to clients_changes
+# in the same transaction
+CHANGES_SCHEMA = {
+    "clients_changes_insert": (
+        "CREATE TRIGGER IF NOT EXISTS clients_changes_insert AFTER INSERT ON clients BEGIN"
+        f" {change_entry('insert', 'new')} END;"
+    ),
+    "clients_changes_update": (
+        "CREATE TRIGGER IF NOT EXISTS clients_changes_update AFTER UPDATE ON clients BEGIN"
+        f" {change_entry('update', 'new')} END;"
+    ),
+    # archival copies the row to clients_archive before deleting it
+    "clients_changes_archive": (
+        "CREATE TRIGGER IF NOT EXISTS clients_changes_archive AFTER DELETE ON clients"
+        " WHEN EXISTS (SELECT 1 FROM clients_archive WHERE id = old.id) BEGIN"
+        f" {change_entry('archive', 'old')} END;"
+    ),
+    "clients_changes_delete": (
+        "CREATE TRIGGER IF NOT EXISTS clients_changes_delete AFTER DELETE ON clients"
+        " WHEN NOT EXISTS (SELECT 1 FROM clients_archive WHERE id = old.id) BEGIN"
+        f" {change_entry('delete', 'old')} END;"
+    ),
+    "clients_archive_changes_delete": (
+        "CREATE TRIGGER IF NOT EXISTS clients_archive_changes_delete AFTER DELETE ON clients_archive BEGIN"
+        f" {change_entry('delete', 'old')} END;"
+    ),
+}
+
+# fills clients_search with the rows that existed before it
+SEARCH_BACKFILL = (
+    "INSERT INTO clients_search (rowid, nom, email, telephone)"
+    f" SELECT {search_values('clients')} FROM clients"
+    f" UNION ALL SELECT {search_values('clients_archive')} FROM clients_archive"
+    " WHERE id NOT IN (SELECT id FROM clients);"
 )
 
+
+def create_indexes(db):
+    """Crée les index, l'index de recherche et les triggers manquants, journalisés dans sql.log comme une migration"""
+    if db._adapter.dbengine != "sqlite":
+        return
+    existing = {name for (name,) in db.executesql("SELECT name FROM sqlite_master;")}
+    statements = [f"DROP INDEX IF EXISTS {name};" for name in OBSOLETE_INDEXES if name in existing]
+    statements += [sql for name, sql in CLIENTS_INDEXES.items() if name not in existing]
+    statements += [sql for name, sql in SEARCH_SCHEMA.items() if name not in existing]
+    statements += [sql for name, sql in CHANGES_SCHEMA.items() if name not in existing]
+    if "clients_search" not in existing:
+        statements.append(SEARCH_BACKFILL)
+    for sql in statements:
+        db.executesql(sql)
+        db._adapter.migrator.log(
+            f"timestamp: {dt.datetime.now().isoformat()}\n{sql}\nsuccess!\n", db.clients
+        )
+    db.commit()
+
+
+def schema_fingerprint():
+    """Empreinte (entier 28 bits) du schéma déclaré, c'est-à-dire de ce fichier
+
+    Tables, index, triggers et migrations de données sont tous définis ici:
+    toute modification du fichier provoque une migration au démarrage suivant.
+    Hacher la source coûte bien moins que redéfinir les tables pour les comparer.
+    """
+    with open(__file__, "rb") as source:
+        return int(hashlib.sha256(source.read()).hexdigest()[:7], 16) or 1
+
+
+def schema_is_current(db, fingerprint):
+    """Vrai si la base a déjà été migrée vers ce schéma (empreinte dans PRAGMA user_version)"""
+    if db._adapter.dbengine != "sqlite":
+        return False
+    return db.executesql("PRAGMA user_version;")[0][0] == fingerprint
+
+
+def store_fingerprint(db, fingerprint):
+    """Enregistre l'empreinte du schéma migré dans la base (PRAGMA user_version)"""
+    if db._adapter.dbengine == "sqlite":
+        db.executesql(f"PRAGMA user_version = {int(fingerprint)};")
+
+
+# fast start: the fingerprint lives in the database itself, so a recreated
+# or restored file is migrated again; a matching one skips pydal's table
+# checks, the backfills and create_indexes
+migrate = settings.DB_MIGRATE
+if migrate and settings.FAST_START:
+    fingerprint = schema_fingerprint()
+    migrate = not schema_is_current(db, fingerprint)
+
+define_tables(db, migrate=migrate)
+define_tables(read_db, migrate=False)
+
+if migrate:
+    # rows created before the `signed` column existed hold NULL, which the
+    # `signed == False` filter of the list action would otherwise skip
+    db(db.clients.signed == None).update(signed=False)  # noqa: E711
+    db(db.clients.terminal == None).update(terminal=settings.DEFAULT_TERMINAL)  # noqa: E711
+    # keep only the most recent active client of each terminal before
+    # enforcing uniqueness
+    latest_active = db(db.clients.active == True)._select(  # noqa: E712
+        db.clients.id.max(), groupby=db.clients.terminal
+    )
+    db((db.clients.active == True) & ~db.clients.id.belongs(latest_active)).update(active=False)  # noqa: E712
+    create_indexes(db)
+    if settings.FAST_START:
+        store_fingerprint(db, fingerprint)
+
 # always commit your models to avoid problems later
 db.commit()
 
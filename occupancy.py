@@ -0,0 +1,172 @@
+"""
+This file maintains the daily_stats table: per-day arrivals, departures,
+signed/unsigned arrivals and guests in-house, updated by the write actions
+in their own transaction so the stats action never aggregates `clients`
+
+    python -m signCheckIn.occupancy --rebuild
+"""
+
+import argparse
+import datetime as dt
+from collections import defaultdict
+
+from loguru import logger
+
+from . import settings
+from .common import clients_changed
+from .importer import parse_date
+from .serializers import select_plain
+
+COUNTERS = ("arrivals", "departures", "signed", "unsigned", "in_house")
+# a longer stay is counted in-house for its first MAX_STAY_DAYS nights only
+MAX_STAY_DAYS = 366
+
+
+def as_date(value):
+    """Date d'une valeur de champ (date, chaîne ISO), None si vide ou invalide"""
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
+def stay_deltas(stay, sign=1, deltas=None):
+    """Ajoute à `deltas` ({jour: {compteur: n}}) la contribution du séjour `stay`
+
+    `stay` a les clés checkin, checkout et signed; sign=-1 retire un séjour
+    (l'état avant une modification).
+    """
+    deltas = defaultdict(lambda: dict.fromkeys(COUNTERS, 0)) if deltas is None else deltas
+    checkin, checkout = as_date(stay.get("checkin")), as_date(stay.get("checkout"))
+    if checkin:
+        deltas[checkin]["arrivals"] += sign
+        deltas[checkin]["signed" if stay.get("signed") else "unsigned"] += sign
+    if checkout:
+        deltas[checkout]["departures"] += sign
+    if checkin and checkout:
+        # in-house on the nights from checkin to the day before checkout
+        for offset in range(min((checkout - checkin).days, MAX_STAY_DAYS)):
+            deltas[checkin + dt.timedelta(days=offset)]["in_house"] += sign
+    return deltas
+
+
+def apply(db, deltas):
+    """Ajoute les `deltas` à daily_stats en un seul executemany (upsert par jour), sans commit"""
+    table = db.daily_stats
+    sql = "INSERT INTO %s (day, %s) VALUES (%s) ON CONFLICT (day) DO UPDATE SET %s;" % (
+        table._rname,
+        ", ".join(COUNTERS),
+        ", ".join(["?"] * (len(COUNTERS) + 1)),
+        ", ".join(f"{name} = {name} + excluded.{name}" for name in COUNTERS),
+    )
+    params = [
+        [day.isoformat()] + [counts[name] for name in COUNTERS]
+        for day, counts in sorted(deltas.items())
+        if any(counts.values())
+    ]
+    if params:
+        db._adapter.cursor.executemany(sql, params)
+
+
+def record(db, before=None, after=None):
+    """Met à jour daily_stats pour un séjour passé de l'état `before` à `after` (None: absent)"""
+    deltas = None
+    if before is not None:
+        deltas = stay_deltas(before, -1, deltas)
+    if after is not None:
+        deltas = stay_deltas(after, 1, deltas)
+    if deltas:
+        apply(db, deltas)
+
+
+def record_many(db, stays):
+    """Ajoute plusieurs nouveaux séjours à daily_stats (import), sans commit"""
+    deltas = None
+    for stay in stays:
+        deltas = stay_deltas(stay, 1, deltas)
+    if deltas:
+        apply(db, deltas)
+
+
+def rebuild(db, batch_size=None):
+    """Recalcule daily_stats depuis clients et clients_archive; renvoie le nombre de séjours
+
+    Les séjours sont lus par lots (curseur sur id), avec daily_stats, dans
+    une même transaction de lecture: un instantané que les écritures (WAL)
+    n'attendent pas. Seule la table des jours est gardée en mémoire. Une
+    courte transaction ajoute ensuite à daily_stats l'écart entre le
+    recalcul et l'instantané: les mises à jour faites pendant la lecture
+    sont gardées.
+    """
+    batch_size = batch_size or settings.STATS_REBUILD_BATCH_SIZE
+    deltas = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    stays = 0
+    try:
+        # one read transaction: the stays and the counters of the same snapshot
+        if not db._adapter.connection.in_transaction:
+            db.executesql("BEGIN;")
+        for table in (db.clients, db.clients_archive):
+            last_id = 0
+            while True:
+                rows = select_plain(
+                    db, table.id > last_id, [table.id, table.checkin, table.checkout, table.signed],
+                    orderby=table.id, limitby=(0, batch_size),
+                )
+                for row in rows:
+                    stay_deltas(row, 1, deltas)
+                stays += len(rows)
+                if len(rows) < batch_size:
+                    break
+                last_id = rows[-1]["id"]
+        stats = db.daily_stats
+        for row in select_plain(db, stats, [stats.day] + [stats[name] for name in COUNTERS]):
+            counts = deltas[as_date(row["day"])]
+            for name in COUNTERS:
+                counts[name] -= row[name]
+        db.commit()
+        # the write lock is only held to add the differences
+        db.executesql("BEGIN IMMEDIATE;")
+        apply(db, deltas)
+        # days left without any stay, as the rebuild from scratch had none
+        empty = None
+        for name in COUNTERS:
+            empty = (stats[name] == 0) if empty is None else empty & (stats[name] == 0)
+        db(empty).delete()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    # the cached stats responses hold the counters from before the rebuild
+    clients_changed.notify()
+    logger.info(f"daily_stats rebuilt from {stays} stays over {len(deltas)} days")
+    return stays
+
+
+def read(db, start, end):
+    """Compteurs de chaque jour de `start` à `end` inclus (zéros pour les jours sans ligne)"""
+    table = db.daily_stats
+    fields = [table.day] + [table[name] for name in COUNTERS]
+    found = {row["day"]: row for row in select_plain(db, (table.day >= start) & (table.day <= end), fields)}
+    empty = dict.fromkeys(COUNTERS, 0)
+    days = []
+    for offset in range((end - start).days + 1):
+        day = (start + dt.timedelta(days=offset)).isoformat()
+        days.append(found.get(day) or dict(day=day, **empty))
+    return days
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="recompute daily_stats from scratch")
+    parser.add_argument("--batch-size", type=int, default=settings.STATS_REBUILD_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    from .models import db
+
+    if args.rebuild:
+        rebuild(db, args.batch_size)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
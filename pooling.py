@@ -0,0 +1,27 @@
+"""
+This file defines PooledDAL: a DAL whose SQLite connections are kept in the
+pool of `pool_size` connections per worker, which pydal turns off for SQLite
+"""
+
+from py4web import DAL
+
+
+class PooledDAL(DAL):
+    """DAL dont les connexions SQLite sont aussi gardées dans un pool"""
+
+    # distinguishes the pools of DALs of different kinds on the same file
+    pool_suffix = ""
+
+    def __init__(self, uri, pool_size=0, **kwargs):
+        super().__init__(uri, pool_size=pool_size, **kwargs)
+        if self._adapter.dbengine == "sqlite":
+            # pydal turns pooling off for SQLite; a pooled connection is only
+            # ever used by one request at a time (check_same_thread=False), and
+            # reusing it saves the connect and the pragmas on every request
+            self._adapter.pool_size = pool_size
+            # pools are keyed by uri: make it absolute so that two databases
+            # with the same relative name in different folders never share one
+            self._adapter.uri = "sqlite://" + self._adapter.dbpath + self.pool_suffix
+            # pydal only creates a pool when it connects with pooling on,
+            # which it was not for the connection opened above
+            self._adapter.POOLS.setdefault(self._adapter.uri, [])
@@ -0,0 +1,102 @@
+"""
+This file defines the SQLProfiler fixture: it captures every statement run
+by a DAL during a request (duration and row count), attaches the totals to
+the request context and logs the statements slower than a threshold
+
+pydal inlines the values in the SQL it generates, so logged statements have
+their literals redacted (`cb` holds card data).
+"""
+
+import re
+import threading
+import time
+
+from loguru import logger
+from py4web import response
+from py4web.core import Fixture
+from pydal.helpers.classes import ExecutionHandler
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+READS = ("SELECT", "WITH", "PRAGMA", "EXPLAIN")
+
+
+def redact(sql):
+    """Remplace les littéraux (chaînes, nombres) de la requête par `?`"""
+    return LITERALS.sub("?", sql)
+
+
+class SQLProfiler(Fixture):
+    """Fixture qui profile les requêtes SQL de `db` pendant chaque requête HTTP"""
+
+    def __init__(self, db, slow_query_ms):
+        self.slow_query_ms = slow_query_ms
+        self._thread = threading.local()
+        self.install(db)
+
+    def install(self, db):
+        """Branche le profiler sur l'adapter de `db`"""
+        profiler = self
+        adapter = db._adapter
+
+        class ProfilingHandler(ExecutionHandler):
+            def before_execute(self, command):
+                profiler._finish(rows=None)
+                self.t0 = time.perf_counter()
+
+            def after_execute(self, command):
+                profiler._thread.pending = (command, self.t0)
+                # SQLite does most of a SELECT while fetching: those are
+                # finished (and counted) by the fetch wrappers below
+                if not command.lstrip().upper().startswith(READS):
+                    profiler._finish(rows=adapter.cursor.rowcount)
+
+        adapter.execution_handlers.append(ProfilingHandler)
+        for name in ("fetchall", "_select_aux_execute"):
+            setattr(adapter, name, self._counting(getattr(adapter, name)))
+
+    def _counting(self, fetch):
+        def wrapper(*args, **kwargs):
+            rows = fetch(*args, **kwargs)
+            self._finish(rows=len(rows))
+            return rows
+        return wrapper
+
+    def _finish(self, rows):
+        pending = getattr(self._thread, "pending", None)
+        if pending is None:
+            return
+        self._thread.pending = None
+        command, t0 = pending
+        duration_ms = (time.perf_counter() - t0) * 1000
+        statements = getattr(self._thread, "statements", None)
+        if statements is not None:
+            statements.append((command, duration_ms, rows))
+        if duration_ms >= self.slow_query_ms:
+            logger.warning(f"Slow query ({duration_ms:.1f} ms, {rows} rows): {redact(command)}")
+
+    def on_request(self, context):
+        Fixture.local_initialize(self)
+        self._thread.pending = None
+        self._thread.statements = []
+
+    def on_success(self, context):
+        self._report(context)
+
+    def on_error(self, context):
+        self._report(context)
+
+    def _report(self, context):
+        self._finish(rows=None)
+        statements, self._thread.statements = self._thread.statements, None
+        totals = dict(
+            count=len(statements),
+            ms=sum(duration for _, duration, _ in statements),
+            rows=sum(rows for _, _, rows in statements if rows and rows > 0),
+        )
+        context["sql"] = dict(totals, statements=statements)
+        response.headers["Server-Timing"] = f'db;dur={totals["ms"]:.2f};desc="{totals["count"]} queries"'
+        logger.debug(f"SQL: {totals['count']} queries, {totals['ms']:.2f} ms, {totals['rows']} rows")
+
+    def statements(self):
+        """Requêtes capturées jusqu'ici dans la requête HTTP en cours"""
+        return list(getattr(self._thread, "statements", None) or [])
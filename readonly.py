@@ -0,0 +1,33 @@
+"""
+This file defines ReadOnlyDAL: a second DAL on the same database whose
+connections are read-only (PRAGMA query_only), pooled apart from the
+writer's, and a fixture for the GET actions
+"""
+
+import types
+
+from .pooling import PooledDAL
+
+
+class ReadOnlyDAL(PooledDAL):
+    """DAL en lecture seule: chaque action GET qui l'utilise prend une connexion du pool
+
+    La connexion est rendue au pool à la fin de la requête; si l'action
+    renvoie un générateur (flux NDJSON), seulement quand le flux est terminé.
+    """
+
+    # its query_only connections must never be handed to the writer
+    pool_suffix = "#readonly"
+
+    def on_success(self, context):
+        output = context.get("output")
+        if isinstance(output, types.GeneratorType):
+            context["output"] = self._recycle_after(output)
+        else:
+            self.recycle_connection_in_pool_or_close("commit")
+
+    def _recycle_after(self, stream):
+        try:
+            yield from stream
+        finally:
+            self.recycle_connection_in_pool_or_close("commit")
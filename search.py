@@ -0,0 +1,60 @@
+"""
+This file defines the guest search: the text typed by the staff becomes an
+FTS5 query over the clients_search index (see models.SEARCH_SCHEMA)
+"""
+
+import re
+
+from .serializers import select_plain
+
+PHONE = re.compile(r"^[\d\s.\-+()/]+$")
+PHONE_SEPARATORS = re.compile(r"[\s.\-+()/]")
+
+
+def match_expression(text):
+    """Requête FTS5 MATCH: chaque mot du texte en préfixe, tous requis; None si vide
+
+    Un texte fait seulement de chiffres et de séparateurs est un numéro de
+    téléphone: ses chiffres forment un seul préfixe, comme dans l'index.
+    """
+    text = (text or "").strip()
+    if not text:
+        return None
+    if PHONE.match(text) and any(char.isdigit() for char in text):
+        words = [PHONE_SEPARATORS.sub("", text)]
+    else:
+        words = text.split()
+    # quoted: FTS5 operators and punctuation typed by the staff are plain text
+    return " ".join('"%s"*' % word.replace('"', '""') for word in words)
+
+
+def search_ids(db, text, limit):
+    """Ids des séjours correspondant à `text`, du plus récent au plus ancien"""
+    expression = match_expression(text)
+    if expression is None:
+        return []
+    # ORDER BY rowid lets FTS5 stop after `limit` matches instead of ranking them all
+    return [
+        row_id
+        for (row_id,) in db.executesql(
+            "SELECT rowid FROM clients_search WHERE clients_search MATCH ? ORDER BY rowid DESC LIMIT ?;",
+            (expression, limit),
+        )
+    ]
+
+
+def search_rows(db, text, limit):
+    """Séjours (en cours puis archivés) correspondant à `text`, avec un drapeau `archived`"""
+    ids = search_ids(db, text, limit)
+    if not ids:
+        return []
+    found = {}
+    for table, archived in ((db.clients, False), (db.clients_archive, True)):
+        missing = [row_id for row_id in ids if row_id not in found]
+        if not missing:
+            break
+        fields = [table[name] for name in db.clients.fields]
+        for row in select_plain(db, table.id.belongs(missing), fields):
+            row["archived"] = archived
+            found[row["id"]] = row
+    return [found[row_id] for row_id in ids if row_id in found]
@@ -0,0 +1,97 @@
+"""
+This file defines the fast serialization path of the JSON actions: rows are
+selected as raw tuples (no pydal Row objects), converted in one pass and
+encoded with orjson when it is installed, the stdlib json module otherwise.
+Payloads can also be laid out in columns, packed with msgpack and
+compressed with gzip or brotli
+"""
+
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder is used instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: msgpack is only offered when installed
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is offered instead
+    brotli = None
+
+# the DAL connects to SQLite with detect_types=PARSE_DECLTYPES, so DATE and
+# TIMESTAMP columns come back as date/datetime objects (as with the other
+# drivers): str() gives the same "YYYY-MM-DD[ HH:MM:SS]" as py4web's dumps
+CONVERTERS = {
+    "boolean": lambda value: value == "T" if isinstance(value, str) else bool(value),
+    "date": str,
+    "datetime": str,
+    "time": str,
+}
+
+
+def json_dumps(payload):
+    """Encode `payload` en JSON compact (orjson si disponible)"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=str).decode()
+    return json.dumps(payload, separators=(",", ":"), default=str)
+
+
+def msgpack_dumps(payload):
+    """Encode `payload` en msgpack (module msgpack requis)"""
+    return msgpack.packb(payload, default=str)
+
+
+def columnar(rows):
+    """Lignes (dicts aux mêmes clés) en colonnes: {fields: noms, rows: tableaux de valeurs}
+
+    Les noms ne sont envoyés qu'une fois au lieu d'être répétés à chaque ligne.
+    """
+    if not rows:
+        return dict(fields=[], rows=[])
+    return dict(fields=list(rows[0]), rows=[list(row.values()) for row in rows])
+
+
+def compress(body, encoding, min_bytes=0):
+    """Compresse `body` en `encoding` (br, gzip) s'il fait au moins `min_bytes` octets
+
+    Renvoie (corps, encodage appliqué): "identity" pour un petit corps, dont
+    l'en-tête gzip coûterait plus qu'il ne ferait gagner.
+    """
+    if encoding not in ("br", "gzip") or len(body) < min_bytes:
+        return body, "identity"
+    if isinstance(body, str):
+        body = body.encode()
+    if encoding == "br":
+        return brotli.compress(body, quality=5), encoding
+    # mtime=0: the same payload always gives the same bytes
+    return gzip.compress(body, compresslevel=6, mtime=0), encoding
+
+
+def plain_rows(fields, rows):
+    """Convertit des tuples bruts en dicts {nom du champ: valeur JSON}"""
+    names = [field.name for field in fields]
+    converters = [
+        (index, CONVERTERS[field.type]) for index, field in enumerate(fields) if field.type in CONVERTERS
+    ]
+    if not converters:
+        return [dict(zip(names, values)) for values in rows]
+    plain = []
+    for values in rows:
+        values = list(values)
+        for index, convert in converters:
+            if values[index] is not None:
+                values[index] = convert(values[index])
+        plain.append(dict(zip(names, values)))
+    return plain
+
+
+def select_plain(db, query, fields, **attributes):
+    """Sélectionne `fields` sans construire de Row: liste de dicts prêts pour json_dumps"""
+    sql = db(query)._select(*fields, **attributes)
+    return plain_rows(fields, db.executesql(sql))
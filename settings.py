@@ -22,16 +22,83 @@ APP_NAME = os.path.split(APP_FOLDER)[-1]
 #               and is the store location for SQLite databases
 DB_FOLDER = os.environ.get("DATABASE_FOLDER", required_folder(APP_FOLDER, "databases"))
 DB_URI = os.environ.get("DATABASE_URL", "sqlite://storage.db")
-DB_POOL_SIZE = 1
+# connections kept in the pool of each worker: one writer, several readers
+DB_POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", 1))
+DB_READ_POOL_SIZE = int(os.environ.get("DATABASE_READ_POOL_SIZE", 4))
 DB_MIGRATE = True
 DB_FAKE_MIGRATE = False
+# fast start: a database already migrated to the declared schema skips the
+# migration checks at boot (see models.py); off in development mode
+FAST_START = os.environ.get("FAST_START", "0" if MODE == "development" else "1") == "1"
+
+# SQLite pragmas applied to every pooled connection: WAL lets kiosk reads
+# run while the front desk commits, busy_timeout (ms) makes writers wait
+# for the lock instead of failing with "database is locked"
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000)),
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # negative: KiB, i.e. 64 MiB
+}
+# the read-only DAL of the GET actions: any write fails on its connections
+SQLITE_READ_PRAGMAS = dict(SQLITE_PRAGMAS, query_only="ON")
+
+# signing kiosk used when a request does not name its terminal
+DEFAULT_TERMINAL = "default"
+
+# long-polling: maximum time (seconds) a kiosk request waits for a change
+LONG_POLL_TIMEOUT = 25
+
+# change counter shared by the workers of this host: it wakes long-polling
+# kiosks and invalidates the cached responses of the read actions
+CHANGES_COUNTER_FILE = os.path.join(DB_FOLDER, "clients.generation")
+CACHE_EXPIRATION = 3600
+
+# list pagination: default and maximum page size, rows fetched per
+# round-trip when streaming NDJSON
+LIST_PAGE_SIZE = 100
+LIST_MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+
+# cached responses at least this large (bytes) are sent compressed to the
+# clients that accept gzip or br
+COMPRESS_MIN_BYTES = 1024
+
+# SQL profiling: statements slower than this (milliseconds) are logged
+# as warnings, with their literals redacted
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+
+# archival of signed, checked-out stays: rows moved per transaction and
+# pause (seconds) between transactions, so writers are never held back long
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_PAUSE = 0.05
+
+# occupancy statistics: stays read per batch by the rebuild command, and
+# the longest range (days) the stats action returns
+STATS_REBUILD_BATCH_SIZE = 10_000
+STATS_MAX_DAYS = 366
+
+# change feed: entries older than this (days) are removed by the compaction
+# command, rows deleted per transaction
+CHANGES_RETENTION_DAYS = 30
+CHANGES_COMPACT_BATCH_SIZE = 5000
 
 # location where static files are stored:
 # STATIC_FOLDER = required_folder(APP_FOLDER, "static")
 
+# static assets: `python -m signCheckIn.assets` copies static/ under
+# content-hashed names into ASSETS_FOLDER, served by the assets action
+STATIC_FOLDER = os.path.join(APP_FOLDER, "static")
+ASSETS_FOLDER = os.environ.get("ASSETS_FOLDER", os.path.join(APP_FOLDER, "static_build"))
+
 # location where to store uploaded files:
 # UPLOAD_FOLDER = required_folder(APP_FOLDER, "uploads")
 
+# signature images, content-addressed (clients.signature holds the digest)
+SIGNATURES_FOLDER = os.environ.get("SIGNATURES_FOLDER", os.path.join(APP_FOLDER, "uploads", "signatures"))
+SIGNATURE_MAX_BYTES = 512 * 1024
+
 # send verification email on registration
 VERIFY_EMAIL = MODE != "development"
 
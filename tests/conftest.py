@@ -0,0 +1,14 @@
+import pytest
+from pydal import DAL
+
+from signCheckIn.models import create_indexes, define_tables
+
+
+@pytest.fixture
+def db():
+    # the application schema and indexes on a private in-memory database
+    db = DAL('sqlite:memory')
+    define_tables(db)
+    create_indexes(db)
+    yield db
+    db.close()
@@ -0,0 +1,73 @@
+import datetime as dt
+from unittest.mock import patch
+
+from signCheckIn import archive
+
+TODAY = dt.date(2024, 6, 15)
+
+
+def stay(db, nom, checkout, signed=True, active=False):
+    return db.clients.insert(
+        nom=nom, email=f'{nom.lower()}@example.com', checkin=checkout - dt.timedelta(days=2),
+        checkout=checkout, cb='4970', signed=signed, active=active,
+    )
+
+
+def test_only_signed_checked_out_stays_are_archived(db):
+    past = TODAY - dt.timedelta(days=1)
+    archived = stay(db, 'Parti', past)
+    unsigned = stay(db, 'Nonsigne', past, signed=False)
+    active = stay(db, 'Actif', past, active=True)
+    in_house = stay(db, 'Present', TODAY + dt.timedelta(days=1))
+    db.commit()
+
+    assert archive.archive_clients(db, before=TODAY, pause=0) == 1
+
+    assert {row.id for row in db(db.clients).select()} == {unsigned, active, in_house}
+    row = db.clients_archive(archived)
+    assert row.nom == 'Parti' and row.signed and row.checkout == past
+    assert row.archived_on is not None
+
+
+def test_archival_commits_in_bounded_batches(db):
+    for i in range(25):
+        stay(db, f'Client{i}', TODAY - dt.timedelta(days=i + 1))
+    db.commit()
+
+    version = archive.clients_changed.version
+    with patch.object(db, 'commit', wraps=db.commit) as commit:
+        moved = archive.archive_clients(db, before=TODAY, batch_size=10, pause=0)
+
+    assert moved == 25
+    assert commit.call_count == 3
+    # one notification per committed batch: cached responses are stale
+    assert archive.clients_changed.version == version + 3
+    assert db(db.clients).count() == 0
+    assert db(db.clients_archive).count() == 25
+
+
+def test_search_archive_filters_and_pages(db):
+    for i in range(5):
+        stay(db, f'Martin{i}', TODAY - dt.timedelta(days=i + 1))
+    stay(db, 'Durand', TODAY - dt.timedelta(days=1))
+    db.commit()
+    archive.archive_clients(db, before=TODAY, pause=0)
+
+    rows, next_id = archive.search_archive(db, nom='martin', limit=3)
+    assert [row.nom for row in rows] == ['Martin4', 'Martin3', 'Martin2']
+    rows, next_id = archive.search_archive(db, nom='martin', after=next_id, limit=3)
+    assert [row.nom for row in rows] == ['Martin1', 'Martin0']
+    assert next_id is None
+
+    rows, _ = archive.search_archive(db, checkout_from=TODAY - dt.timedelta(days=2))
+    assert {row.nom for row in rows} == {'Martin0', 'Martin1', 'Durand'}
+
+
+def test_archival_and_name_search_use_indexes(db):
+    plans = [
+        db.executesql('EXPLAIN QUERY PLAN ' + db(archive.archivable(db, TODAY))._select(db.clients.id)),
+        db.executesql('EXPLAIN QUERY PLAN ' + db(db.clients_archive.nom.like('mar%'))._select()),
+    ]
+    for plan in plans:
+        details = ' '.join(row[-1] for row in plan)
+        assert 'SCAN' not in details.replace('COVERING INDEX', ''), details
@@ -0,0 +1,75 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from signCheckIn import assets
+
+
+@pytest.fixture
+def static(tmp_path):
+    folder = tmp_path / 'static'
+    (folder / 'css').mkdir(parents=True)
+    (folder / 'webfonts').mkdir()
+    (folder / 'webfonts' / 'icons.woff2').write_bytes(b'wOF2' + bytes(100))
+    (folder / 'css' / 'site.css').write_text(
+        "@font-face{src:url(../webfonts/icons.woff2) format('woff2'),url('../webfonts/icons.eot?#iefix')}\n"
+        'body{background:url(data:image/png;base64,AAAA)}\n' + 'p{margin:0}\n' * 200
+    )
+    (folder / '.hidden').write_text('x')
+    return folder
+
+
+def test_build_hashes_and_rewrites_css(static, tmp_path):
+    target = tmp_path / 'build'
+
+    manifest = assets.build(str(static), str(target))
+
+    font = manifest['webfonts/icons.woff2']
+    assert set(manifest) == {'css/site.css', 'webfonts/icons.woff2'}
+    assert font.startswith('webfonts/icons.') and font.endswith('.woff2')
+    css = (target / manifest['css/site.css']).read_text()
+    assert f'url(../{font}) format' in css
+    # unknown and data: urls are left alone
+    assert "url('../webfonts/icons.eot?#iefix')" in css and 'url(data:image/png' in css
+    assert gzip.decompress((target / (manifest['css/site.css'] + '.gz')).read_bytes()).decode() == css
+    # fonts are already compressed
+    assert not (target / (font + '.gz')).exists()
+    assert json.loads((target / 'manifest.json').read_text()) == manifest
+    # same content, same names
+    assert assets.build(str(static), str(target)) == manifest
+
+
+def test_new_content_gets_a_new_name(static, tmp_path):
+    target = tmp_path / 'build'
+    first = assets.build(str(static), str(target))
+    (static / 'webfonts' / 'icons.woff2').write_bytes(b'wOF2' + bytes(200))
+
+    second = assets.build(str(static), str(target))
+
+    # the stylesheet changes with the font it points to
+    assert second['webfonts/icons.woff2'] != first['webfonts/icons.woff2']
+    assert second['css/site.css'] != first['css/site.css']
+    assert (target / first['css/site.css']).exists()
+
+
+def test_find_prefers_precompressed_and_stays_in_the_build(static, tmp_path):
+    manifest = assets.build(str(static), str(tmp_path / 'build'))
+    store = assets.Assets(str(tmp_path / 'build'))
+    css = manifest['css/site.css']
+
+    assert store.find(css, ['gzip']) == (os.path.join(store.folder, *css.split('/')) + '.gz', 'gzip')
+    assert store.find(css, [])[1] == 'identity'
+    for name in ('manifest.json', '../static/css/site.css', 'css/missing.css'):
+        with pytest.raises(ValueError):
+            store.find(name)
+    assert store.content_type(css) == 'text/css; charset=utf-8'
+    assert store.content_type(manifest['webfonts/icons.woff2']) == 'font/woff2'
+
+
+def test_missing_build_falls_back_to_static(tmp_path):
+    store = assets.Assets(str(tmp_path / 'nothing'))
+
+    assert store.manifest == {}
+    assert store.url('vendor/fontawesome/css/all.min.css', None) is None
@@ -0,0 +1,44 @@
+from signCheckIn.benchmarks import controllers as bench
+
+
+def test_benchmark_smoke(tmp_path):
+    results = bench.run_size(200, repeat=2, folder=str(tmp_path))
+
+    assert set(results) >= {'insert', 'modify', 'active_client', 'list_clients', 'disable_all_other_clients'}
+    assert all(stats['median_ms'] >= 0 for stats in results.values())
+
+
+def test_benchmark_compare_flags_regressions(capsys):
+    baseline = {'results': {'1000': {'insert': {'median_ms': 1.0}, 'modify': {'median_ms': 1.0}}}}
+    current = {'results': {'1000': {'insert': {'median_ms': 2.0}, 'modify': {'median_ms': 1.1}}}}
+
+    regressions = bench.compare(current, baseline, threshold=1.25)
+
+    assert [(size, name) for size, name, _ in regressions] == [('1000', 'insert')]
+    assert 'REGRESSION' in capsys.readouterr().out
+
+
+def test_serialization_benchmark_smoke(tmp_path):
+    from signCheckIn.benchmarks import serialization
+
+    results = serialization.run_size(200, repeat=1, folder=str(tmp_path))
+
+    assert {'rows', 'plain'} <= set(results)
+    assert all(stats['us_per_row'] >= 0 for stats in results.values())
+
+
+def test_startup_benchmark_smoke(tmp_path):
+    from signCheckIn.benchmarks import startup
+
+    results = startup.measure(50, repeat=1, folder=str(tmp_path))
+
+    assert set(results) == {'fast_start', 'migrate', 'py4web_import'}
+    assert all(stats['median_ms'] > 0 for stats in results.values())
+
+
+def test_export_benchmark_smoke(tmp_path):
+    from signCheckIn.benchmarks import export
+
+    results = export.run_size(200, folder=str(tmp_path))
+
+    assert results['bytes'] > 0 and results['peak_kib'] > 0
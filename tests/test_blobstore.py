@@ -0,0 +1,86 @@
+import hashlib
+import io
+
+import pytest
+
+from signCheckIn.blobstore import PNG_MAGIC, BlobStore, image_type
+
+PNG = PNG_MAGIC + b'\x00' * 200_000
+
+
+class ChunkedReader(io.BytesIO):
+    """wsgi.input stand-in recording the largest read."""
+
+    largest = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.largest = max(self.largest, len(chunk))
+        return chunk
+
+
+def test_put_streams_by_chunks_and_addresses_by_content(tmp_path):
+    store = BlobStore(str(tmp_path), chunk_size=4096)
+    body = ChunkedReader(PNG)
+
+    digest = store.put(body, len(PNG))
+
+    assert digest == hashlib.sha256(PNG).hexdigest()
+    assert body.largest == 4096
+    with open(store.path(digest), 'rb') as stream:
+        assert stream.read() == PNG
+    assert store.put(io.BytesIO(PNG), len(PNG)) == digest
+
+
+def test_rejected_or_truncated_bodies_leave_nothing(tmp_path):
+    store = BlobStore(str(tmp_path))
+
+    def check(head):
+        raise ValueError('Not an image')
+
+    with pytest.raises(ValueError):
+        store.put(io.BytesIO(b'GIF89a'), 6, check=check)
+    with pytest.raises(ValueError):
+        store.put(io.BytesIO(PNG[:10]), len(PNG))
+    # an empty body is still checked
+    with pytest.raises(ValueError):
+        store.put(io.BytesIO(b''), 0, check=check)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+class TrickleReader(io.BytesIO):
+    """wsgi.input stand-in returning at most 3 bytes per read."""
+
+    def read(self, size=-1):
+        return super().read(min(size, 3))
+
+
+def test_check_sees_the_head_whatever_the_reads(tmp_path):
+    store = BlobStore(str(tmp_path))
+    heads = []
+
+    def check(head):
+        heads.append(head)
+        if image_type(head) is None:
+            raise ValueError('Not an image')
+
+    digest = store.put(TrickleReader(PNG), len(PNG), check=check)
+    store.put(TrickleReader(PNG[:20]), 20, check=check)
+
+    assert digest == hashlib.sha256(PNG).hexdigest()
+    assert heads == [PNG[:1024], PNG[:20]]
+
+
+def test_path_rejects_non_digests(tmp_path):
+    with pytest.raises(ValueError):
+        BlobStore(str(tmp_path)).path('../../etc/passwd')
+
+
+def test_image_type():
+    assert image_type(PNG) == 'image/png'
+    assert image_type(b'<?xml version="1.0"?>\n<svg xmlns="http://www.w3.org/2000/svg">') == 'image/svg+xml'
+    assert image_type(b'<!-- kiosk -->\n<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" "x.dtd">\n<svg/>') == 'image/svg+xml'
+    assert image_type(b'GIF89a') is None
+    assert image_type(b'<html><body><svg onload="alert(1)"></svg>') is None
+    assert image_type(b'<svgfoo>') is None
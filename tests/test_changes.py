@@ -0,0 +1,57 @@
+import datetime as dt
+
+import pytest
+
+from signCheckIn import archive, changes
+
+
+def ops(entries):
+    return [(entry['id'], entry['op']) for entry in entries]
+
+
+def test_every_write_is_logged_in_order(db):
+    first = db.clients.insert(nom='Martin', checkout='2023-01-02')
+    second = db.clients.insert(nom='Durand')
+    db(db.clients.id == second).update(nom='Durand-Petit')
+    db(db.clients.id == first).update(signed=True)
+    db.commit()
+    archive.archive_clients(db, before=dt.date(2023, 2, 1), pause=0)
+    db(db.clients.id == second).delete()
+    db.commit()
+
+    entries, next_seq, more = changes.read(db, 0, 10)
+
+    # one entry per client, at its last change, with its current state
+    assert ops(entries) == [(first, 'archive'), (second, 'delete')]
+    assert entries[0]['data']['nom'] == 'Martin'
+    assert entries[1]['data'] is None
+    assert next_seq == changes.last_seq(db) == 6
+    assert not more
+
+
+def test_pages_resume_after_next(db):
+    for name in 'ABCDE':
+        db.clients.insert(nom=name)
+    db.commit()
+
+    entries, next_seq, more = changes.read(db, 0, 2)
+    assert [entry['data']['nom'] for entry in entries] == ['A', 'B'] and more
+    entries, next_seq, more = changes.read(db, next_seq, 10)
+    assert [entry['data']['nom'] for entry in entries] == ['C', 'D', 'E'] and not more
+    assert changes.read(db, next_seq, 10) == ([], next_seq, False)
+
+
+def test_compaction_keeps_the_last_entry_and_expires_old_cursors(db):
+    for name in 'ABC':
+        db.clients.insert(nom=name)
+    db.commit()
+    version = changes.clients_changed.version
+
+    assert changes.compact(db, before=dt.datetime.now() + dt.timedelta(days=1), batch_size=1) == 2
+    # one notification per committed batch: cached pages of the compacted log expire
+    assert changes.clients_changed.version == version + 2
+    assert changes.first_seq(db) == changes.last_seq(db) == 3
+
+    assert changes.read(db, 2, 10)[1] == 3
+    with pytest.raises(changes.ChangesExpired):
+        changes.read(db, 1, 10)
@@ -0,0 +1,128 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+from pydal import DAL, Field
+
+from signCheckIn import settings
+from signCheckIn.common import sqlite_pragmas
+
+
+def connect(folder, **pragmas):
+    """One connection of a worker: a DAL on the shared database file."""
+    handle = DAL(
+        'sqlite://concurrency.db',
+        folder=str(folder),
+        after_connection=sqlite_pragmas(dict(settings.SQLITE_PRAGMAS, **pragmas)),
+    )
+    handle.define_table('clients', Field('nom', 'string'))
+    handle.commit()
+    return handle
+
+
+def test_pragmas_applied_on_connection(tmp_path):
+    handle = connect(tmp_path)
+
+    assert handle.executesql('PRAGMA journal_mode;')[0][0] == 'wal'
+    assert handle.executesql('PRAGMA synchronous;')[0][0] == 1  # NORMAL
+    assert handle.executesql('PRAGMA busy_timeout;')[0][0] == settings.SQLITE_PRAGMAS['busy_timeout']
+    handle.close()
+
+
+@pytest.mark.parametrize('journal_mode, commit_succeeds', [('DELETE', False), ('WAL', True)])
+def test_writer_commits_during_open_read(tmp_path, journal_mode, commit_succeeds):
+    reader = connect(tmp_path, journal_mode=journal_mode, busy_timeout=100)
+    writer = connect(tmp_path, journal_mode=journal_mode, busy_timeout=100)
+
+    # a kiosk in the middle of a read transaction
+    reader.executesql('BEGIN;')
+    reader.executesql('SELECT count(*) FROM clients;')
+
+    writer.clients.insert(nom='Front desk')
+    if commit_succeeds:
+        writer.commit()
+    else:
+        # the rollback journal needs readers gone to commit
+        with pytest.raises(sqlite3.OperationalError, match='locked'):
+            writer.commit()
+    reader.commit()
+    reader.close()
+    writer.close()
+
+
+def test_parallel_readers_and_writers(tmp_path):
+    connect(tmp_path).close()
+    errors, reads, writes = [], [], []
+    deadline = time.monotonic() + 0.5
+
+    def reader():
+        handle = connect(tmp_path)
+        try:
+            while time.monotonic() < deadline:
+                handle.executesql('SELECT count(*) FROM clients;')
+                handle.commit()
+                reads.append(1)
+        except sqlite3.OperationalError as error:
+            errors.append(error)
+        handle.close()
+
+    def writer():
+        handle = connect(tmp_path)
+        try:
+            while time.monotonic() < deadline:
+                handle.clients.insert(nom='Client')
+                handle.commit()
+                writes.append(1)
+        except sqlite3.OperationalError as error:
+            errors.append(error)
+        handle.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    threads += [threading.Thread(target=writer) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert reads and writes
+
+
+def test_writer_pool_size_applies_to_sqlite(tmp_path):
+    from signCheckIn.pooling import PooledDAL
+    from signCheckIn.readonly import ReadOnlyDAL
+
+    writer = PooledDAL('sqlite://pooled.db', folder=str(tmp_path), pool_size=3)
+    reader = ReadOnlyDAL('sqlite://pooled.db', folder=str(tmp_path), pool_size=2)
+
+    assert writer._adapter.pool_size == 3
+    # same file, separate pools: a read-only connection never reaches the writer
+    assert writer._adapter.uri != reader._adapter.uri
+    writer.executesql('SELECT 1;')
+    writer.recycle_connection_in_pool_or_close('commit')
+    assert len(writer._adapter.POOLS[writer._adapter.uri]) == 1
+    assert not reader._adapter.POOLS.get(reader._adapter.uri)
+    reader.close()
+
+
+def test_writer_fixture_returns_its_connection_to_the_pool(tmp_path):
+    from py4web.core import action
+    from pydal.connection import THREAD_LOCAL
+    from signCheckIn.pooling import PooledDAL
+
+    writer = PooledDAL('sqlite://fixture.db', folder=str(tmp_path), pool_size=2)
+    writer.define_table('clients', Field('nom', 'string'))
+    writer.commit()
+    # a write action, run through the fixture pipeline as @action.uses(db) does
+    insert = action.uses(writer)(lambda: writer.clients.insert(nom='Pooled'))
+
+    insert()
+    connection = writer._adapter.POOLS[writer._adapter.uri][-1]
+    insert()
+
+    # committed, released by the thread, and the same connection served both requests
+    assert getattr(THREAD_LOCAL, writer._adapter._connection_uname_, None) is None
+    assert writer._adapter.POOLS[writer._adapter.uri] == [connection]
+    assert writer(writer.clients).count() == 2
+    writer.close()
@@ -1,38 +1,27 @@
+import json
 import pytest
 from unittest.mock import patch, MagicMock
 from datetime import datetime
-from pydal import DAL, Field
+import datetime as dt
 from py4web import request, HTTP
 from ombott.response import HTTPError
 
 # Import the functions from controllers.py
-from signCheckIn.controllers import insert, modify, active_client, disable_all_other_clients, list_clients
-from signCheckIn.models import db
+from signCheckIn.controllers import insert, modify, active_client, disable_all_other_clients, list_clients, wait_active_client, import_clients, ready, metrics_text, archived_clients, sign, signature_file, arrivals, departures, stats, changes_feed, export_stays, asset_file
+from signCheckIn.common import clients_changed
 
 @pytest.fixture(scope="function")
-def test_db():
-    # Use an in-memory SQLite database for testing
-    test_db = DAL('sqlite:memory:')
-    test_db.define_table('clients',
-        Field('nom', 'string'),
-        Field('email', 'string'),
-        Field('telephone', 'string'),
-        Field('checkin', 'date'),
-        Field('checkout', 'date'),
-        Field('cb', 'string'),
-        Field("signed", "boolean", default=False),
-        Field("active", "boolean", default=False),
-        Field('created_on', 'datetime', default=datetime.now),
-    )
-    test_db.commit()
+def test_db(db):
+    # New generation: responses cached by a previous test are stale
+    clients_changed.notify()
     # Temporarily replace the global db
     import signCheckIn.controllers as controllers
-    original_db = controllers.db
-    controllers.db = test_db
-    yield test_db
-    controllers.db = original_db
-    test_db.close()
-    
+    original_db, original_read_db = controllers.db, controllers.read_db
+    # one connection for the writer and the readers: reads see uncommitted test data
+    controllers.db = controllers.read_db = db
+    yield db
+    controllers.db, controllers.read_db = original_db, original_read_db
+
 
 @pytest.fixture(scope="function")
 def test_db_with_data(test_db):
@@ -58,33 +47,28 @@ def test_db_with_data(test_db):
         active=False
     )
     test_db.commit()
+    clients_changed.notify()
     
     # Verify active client
     active_clients = test_db(test_db.clients.active == True).select()
     assert len(active_clients) == 1  # There should be always only one active client
     assert active_clients[0].email == 'fake1@example.com'
-    
-    # Temporarily replace the global db
-    import signCheckIn.controllers as controllers
-    original_db = controllers.db
-    controllers.db = test_db
-    yield test_db
-    controllers.db = original_db
+    return test_db
 
 
 def test_disable_all_other_clients(test_db):
-    # Insert some test clients
+    # Insert some test clients: the unique index allows one active client per terminal
     test_db.clients.insert(nom='Client1', active=True)
-    test_db.clients.insert(nom='Client2', active=True)
+    test_db.clients.insert(nom='Client2', active=True, terminal='lobby')
     test_db.commit()
 
     # Call the function
     disable_all_other_clients()
 
-    # Check that all are inactive
+    # Only the active client of the default terminal is disabled
     rows = test_db(test_db.clients.active == True).select()
-    assert len(rows) == 0
-    
+    assert [row.nom for row in rows] == ['Client2']
+
 
 @patch('signCheckIn.controllers.request')
 def test_insert(mock_req, test_db_with_data):
@@ -123,6 +107,38 @@ def test_insert(mock_req, test_db_with_data):
         assert each_client.active is False  # All other clients should be inactive
 
 
+@patch('signCheckIn.controllers.request')
+def test_insert_reservation_is_idempotent(mock_req, test_db_with_data):
+    mock_req.json = {'nom': 'PMS Client', 'reservation': 'R-1001', 'checkin': '2023-10-01'}
+    first = insert()
+
+    # the active client changes in between: a retry must not take it back
+    mock_req.json = {'nom': 'Walk-in'}
+    insert()
+    version = clients_changed.version
+    mock_req.json = {'nom': 'PMS Client (retry)', 'reservation': 'R-1001'}
+    retry = insert()
+
+    assert first['inserted'] is True
+    assert retry == {'id': first['id'], 'inserted': False}
+    assert test_db_with_data(test_db_with_data.clients.reservation == 'R-1001').count() == 1
+    assert test_db_with_data.clients(first['id']).nom == 'PMS Client'
+    active = test_db_with_data(test_db_with_data.clients.active == True).select()
+    assert [c.nom for c in active] == ['Walk-in']
+    assert clients_changed.version == version
+
+
+@patch('signCheckIn.controllers.request')
+def test_insert_reservation_activates_new_client(mock_req, test_db_with_data):
+    mock_req.json = {'nom': 'PMS Client', 'reservation': ' R-2002 '}
+
+    result = insert()
+
+    client = test_db_with_data.clients(result['id'])
+    assert client.reservation == 'R-2002' and client.active is True
+    assert test_db_with_data(test_db_with_data.clients.active == True).count() == 1
+
+
 @patch('signCheckIn.controllers.request')
 def test_insert_two_clients(mock_req, test_db):
     # Mocking request for POST method
@@ -222,7 +238,7 @@ def test_active_client(test_db):
     test_db.clients.insert(nom='Active Client2', active=True)
     test_db.commit()
 
-    response = active_client()
+    response = json.loads(active_client())
 
     assert 'data' in response
     assert len(response['data']) == 1
@@ -234,7 +250,7 @@ def test_active_client_no_client_active(test_db):
     test_db.clients.insert(nom='Active Client1', active=False)
     test_db.clients.insert(nom='Active Client2', active=False)
     
-    response = active_client()
+    response = json.loads(active_client())
     
     assert 'data' in response
     assert len(response['data']) == 0
@@ -243,11 +259,702 @@ def test_active_client_no_client_active(test_db):
 def test_list(test_db_with_data):
     # Insert some clients
 
-    response = list_clients()
+    response = json.loads(list_clients())
 
     assert 'data' in response
     assert len(response['data']) == 2
-    
+
+
+def test_list_excludes_signed(test_db_with_data):
+    test_db_with_data.clients.insert(nom='Signed Client', signed=True)
+    test_db_with_data.commit()
+
+    response = json.loads(list_clients())
+
+    assert len(response['data']) == 2
+    assert 'Signed Client' not in [r['nom'] for r in response['data']]
+    assert response['next'] is None
+
+
+@patch('signCheckIn.controllers.request')
+def test_list_keyset_pagination(mock_req, test_db):
+    # same created_on for every row: the id breaks the ties
+    created_on = datetime(2024, 1, 1, 12, 0, 0)
+    for i in range(5):
+        test_db.clients.insert(nom=f'Client{i}', created_on=created_on)
+    test_db.clients.insert(nom='Newest', created_on=datetime(2024, 1, 2))
+    test_db.commit()
+
+    names = []
+    mock_req.query = {'limit': '2'}
+    while True:
+        response = json.loads(list_clients())
+        names += [r['nom'] for r in response['data']]
+        if not response['next']:
+            break
+        mock_req.query = {'limit': '2', 'after': response['next']}
+
+    assert names == ['Newest', 'Client4', 'Client3', 'Client2', 'Client1', 'Client0']
+
+
+@patch('signCheckIn.controllers.request')
+def test_list_fields_projection_keeps_paging(mock_req, test_db):
+    for i in range(3):
+        test_db.clients.insert(nom=f'Client{i}', cb='4970101234567890')
+    test_db.commit()
+    mock_req.headers = {}
+
+    mock_req.query = {'limit': '2', 'fields': 'nom,checkin'}
+    response = json.loads(list_clients())
+    assert response['data'] == [dict(nom='Client2', checkin=None), dict(nom='Client1', checkin=None)]
+    mock_req.query = {'limit': '2', 'fields': 'nom', 'after': response['next']}
+    assert json.loads(list_clients())['data'] == [dict(nom='Client0')]
+
+    mock_req.query = {'fields': 'nom,password'}
+    with pytest.raises(HTTPError) as excinfo:
+        list_clients()
+    assert excinfo.value.status_code == 400
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_list_columns_and_gzip(mock_req, mock_resp, test_db):
+    import gzip
+    for i in range(100):
+        test_db.clients.insert(nom=f'Client{i}')
+    test_db.commit()
+    mock_resp.headers = {}
+    mock_req.query = {'fields': 'id,nom', 'layout': 'columns'}
+    mock_req.headers = {'Accept-Encoding': 'gzip, deflate, br;q=0'}
+
+    response = json.loads(gzip.decompress(list_clients()))
+
+    assert response['data']['fields'] == ['id', 'nom']
+    assert response['data']['rows'][0] == [100, 'Client99']
+    assert mock_resp.headers['Content-Encoding'] == 'gzip'
+    assert mock_resp.headers['Vary'] == 'Accept, Accept-Encoding'
+    etag = mock_resp.headers['ETag']
+
+    # another representation of the same page is another variant
+    mock_req.headers = {}
+    mock_resp.headers = {}
+    assert json.loads(list_clients())['data']['fields'] == ['id', 'nom']
+    assert 'Content-Encoding' not in mock_resp.headers
+    assert mock_resp.headers['ETag'] != etag
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_active_client_fields(mock_req, mock_resp, test_db_with_data):
+    mock_resp.headers = {}
+    mock_req.headers = {'Accept': 'application/msgpack', 'Accept-Encoding': 'gzip'}
+    mock_req.query = {'fields': 'nom'}
+    packb = MagicMock(return_value=b'packed')
+
+    with patch('signCheckIn.serializers.msgpack', MagicMock(packb=packb)):
+        body = active_client()
+
+    assert mock_resp.headers['Content-Type'] == 'application/msgpack'
+    assert body == b'packed'
+    assert packb.call_args.args == ({'data': [{'nom': 'CLient1 Active'}]},)
+    # small body: not worth compressing
+    assert 'Content-Encoding' not in mock_resp.headers
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_active_client_msgpack_falls_back_to_json(mock_req, mock_resp, test_db_with_data):
+    mock_resp.headers = {}
+    mock_req.headers = {'Accept': 'application/msgpack'}
+    mock_req.query = {'fields': 'nom'}
+
+    with patch('signCheckIn.serializers.msgpack', None):
+        body = active_client()
+
+    assert mock_resp.headers['Content-Type'] == 'application/json'
+    assert json.loads(body) == {'data': [{'nom': 'CLient1 Active'}]}
+
+
+@patch('signCheckIn.controllers.request')
+def test_list_invalid_cursor(mock_req, test_db):
+    mock_req.query = {'after': 'garbage'}
+
+    with pytest.raises(HTTPError):
+        list_clients()
+
+
+@patch('signCheckIn.controllers.request')
+def test_list_ndjson_stream(mock_req, test_db_with_data):
+    mock_req.query = {'format': 'ndjson'}
+
+    lines = "".join(list_clients()).splitlines()
+
+    rows = [json.loads(line) for line in lines]
+    assert [r['nom'] for r in rows] == ['Client2 Inactive', 'CLient1 Active']
+    assert rows[1]['active'] is True
+    assert rows[1]['signed'] is False
+
+
+@patch('signCheckIn.controllers.request')
+def test_controller_queries_use_indexes(mock_req, test_db_with_data):
+    # pydal records every executed statement in the thread-local timings
+    del test_db_with_data._timings[:]
+    mock_req.query = {'limit': '1'}
+    mock_req.json = {'nom': 'Indexed Client', 'checkin': '2023-10-01', 'checkout': '2023-10-05'}
+
+    active_client()
+    mock_req.query = {'limit': '1', 'after': json.loads(list_clients())['next']}
+    list_clients()
+    insert()
+    modify(1)
+
+    statements = [
+        sql for sql, _ in test_db_with_data._timings
+        if sql.startswith(('SELECT', 'UPDATE')) and '"clients"' in sql
+    ]
+    assert len(statements) >= 5
+    for sql in statements:
+        plan = [row[-1] for row in test_db_with_data.executesql('EXPLAIN QUERY PLAN ' + sql)]
+        table_scans = [step for step in plan if step.startswith('SCAN') and 'USING' not in step]
+        assert not table_scans, (sql, plan)
+
+
+@patch('signCheckIn.controllers.request')
+def test_arrivals_and_departures_pages(mock_req, test_db_with_data):
+    for nom, checkin, checkout in [('A', '2023-03-01', '2023-03-03'), ('B', '2023-03-01', '2023-03-02'),
+                                   ('C', '2023-03-02', '2023-03-04'), ('D', '2023-03-05', '2023-03-06')]:
+        test_db_with_data.clients.insert(nom=nom, checkin=checkin, checkout=checkout, cb='4970')
+    test_db_with_data.commit()
+    clients_changed.notify()
+    del test_db_with_data._timings[:]
+    mock_req.headers = {}
+
+    mock_req.query = {'from': '2023-03-01', 'to': '2023-03-02', 'limit': '2'}
+    first = json.loads(arrivals())
+    mock_req.query = dict(mock_req.query, after=first['next'])
+    second = json.loads(arrivals())
+    mock_req.query = {'from': '2023-03-03'}
+    leaving = json.loads(departures())
+
+    assert [r['nom'] for r in first['data']] == ['A', 'B']
+    assert [r['nom'] for r in second['data']] == ['C'] and second['next'] is None
+    assert [r['nom'] for r in leaving['data']] == ['A']
+    assert 'cb' not in first['data'][0] and first['data'][0]['checkin'] == '2023-03-01'
+
+    statements = [sql for sql, _ in test_db_with_data._timings if sql.startswith('SELECT')]
+    assert len(statements) == 3
+    for sql in statements:
+        plan = [row[-1] for row in test_db_with_data.executesql('EXPLAIN QUERY PLAN ' + sql)]
+        assert plan[0].startswith('SEARCH') and 'USE TEMP B-TREE' not in ' '.join(plan), (sql, plan)
+
+
+@patch('signCheckIn.controllers.request')
+def test_arrivals_rejects_bad_dates(mock_req, test_db):
+    for query in ({'from': '01/03/2023'}, {'from': '2023-03-02', 'to': '2023-03-01'}, {'after': 'x'}):
+        mock_req.query = query
+        with pytest.raises(HTTPError) as excinfo:
+            arrivals()
+        assert excinfo.value.status_code == 400
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_stats_follow_writes(mock_req, mock_resp, test_db, signature_store):
+    import io
+    from signCheckIn import occupancy
+    from signCheckIn.blobstore import PNG_MAGIC
+    mock_req.headers = {}
+    mock_resp.headers = {}
+    mock_req.json = {'nom': 'A', 'checkin': '2023-05-01', 'checkout': '2023-05-03'}
+    insert()
+    mock_req.json = {'nom': 'B', 'checkin': '2023-05-01', 'checkout': '2023-05-02'}
+    insert()
+    mock_req.json = {'nom': 'B', 'checkin': '2023-05-02', 'checkout': '2023-05-04'}
+    modify(2)
+    mock_req.environ = {'CONTENT_LENGTH': str(len(PNG_MAGIC)), 'wsgi.input': io.BytesIO(PNG_MAGIC)}
+    sign(1)
+
+    mock_req.query = {'from': '2023-05-01', 'to': '2023-05-04'}
+    days = json.loads(stats())['data']
+
+    assert [d['arrivals'] for d in days] == [1, 1, 0, 0]
+    assert [(d['signed'], d['unsigned']) for d in days[:2]] == [(1, 0), (0, 1)]
+    assert [d['in_house'] for d in days] == [1, 2, 1, 0]
+    assert [d['departures'] for d in days] == [0, 0, 1, 1]
+    # the incremental counts are those a rebuild computes
+    occupancy.rebuild(test_db)
+    assert occupancy.read(test_db, dt.date(2023, 5, 1), dt.date(2023, 5, 4)) == days
+
+    mock_req.query = {'from': '2023-01-01', 'to': '2024-12-31'}
+    with pytest.raises(HTTPError):
+        stats()
+
+
+@patch('signCheckIn.controllers.request')
+def test_stats_count_the_stored_dates(mock_req, test_db):
+    from signCheckIn import occupancy
+    # pydal stores a date for these strings, which are not plain ISO dates
+    mock_req.json = {'nom': 'A', 'checkin': '2024-03-01T10:00', 'checkout': '2024-03-02 10:00:00'}
+    insert()
+    mock_req.json = {'nom': 'B', 'checkin': '2024-03-01 10:00:00', 'reservation': 'R-1'}
+    insert()
+    mock_req.json = {'nom': 'A', 'checkin': '2024-03-02T09:30', 'checkout': '2024-03-03T11:00'}
+    modify(1)
+    days = occupancy.read(test_db, dt.date(2024, 3, 1), dt.date(2024, 3, 3))
+
+    assert [d['arrivals'] for d in days] == [1, 1, 0]
+    occupancy.rebuild(test_db)
+    assert occupancy.read(test_db, dt.date(2024, 3, 1), dt.date(2024, 3, 3)) == days
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_changes_feed_follows_writes(mock_req, mock_resp, test_db_with_data, signature_store):
+    import io
+    from signCheckIn.blobstore import PNG_MAGIC
+    mock_req.headers = {}
+    mock_resp.headers = {}
+    mock_req.query = {}
+    start = changes_feed()['next']
+    mock_req.json = {'nom': 'New', 'checkin': '2023-05-01', 'checkout': '2023-05-03'}
+    insert()
+    mock_req.environ = {'CONTENT_LENGTH': str(len(PNG_MAGIC)), 'wsgi.input': io.BytesIO(PNG_MAGIC)}
+    sign(3)
+
+    mock_req.query = {'since': str(start), 'limit': '10'}
+    page = json.loads(changes_feed())
+
+    # client 1 was deactivated by the insert; client 3 inserted then signed
+    assert [(change['id'], change['op']) for change in page['data']] == [(1, 'update'), (3, 'update')]
+    assert page['data'][1]['data']['signed'] is True
+    assert page['more'] is False
+    mock_req.query = {'since': str(page['next'])}
+    assert json.loads(changes_feed())['data'] == []
+
+    mock_req.query = {'since': 'x'}
+    with pytest.raises(HTTPError) as excinfo:
+        changes_feed()
+    assert excinfo.value.status_code == 400
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_export_streams_csv(mock_req, mock_resp, test_db_with_data):
+    mock_resp.headers = {}
+    mock_req.query = {'from': '2023-01-01', 'to': '2023-01-31'}
+
+    body = ''.join(export_stays())
+
+    lines = body.removeprefix('\ufeff').splitlines()
+    assert lines[0].startswith('id,nom,email')
+    assert len(lines) == 3 and lines[1].split(',')[6] == '****'
+    assert mock_resp.headers['Content-Type'].startswith('text/csv')
+    assert 'Content-Length' not in mock_resp.headers
+
+    mock_req.query = {'from': '2023-01-01', 'cb': 'omit'}
+    assert ',cb,' not in ''.join(export_stays())
+    mock_req.query = {'cb': 'plain'}
+    with pytest.raises(HTTPError) as excinfo:
+        export_stays()
+    assert excinfo.value.status_code == 400
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_changes_feed_sees_archival(mock_req, mock_resp, test_db_with_data):
+    from signCheckIn import archive
+    mock_req.headers = {}
+    mock_resp.headers = {}
+    test_db_with_data(test_db_with_data.clients.id == 2).update(signed=True)
+    test_db_with_data.commit()
+    mock_req.query = {'since': '0'}
+    last = json.loads(changes_feed())['next']
+    mock_req.query = {'since': str(last)}
+    assert json.loads(changes_feed())['data'] == []
+
+    archive.archive_clients(test_db_with_data, before=dt.date(2024, 1, 1), pause=0)
+
+    # same query: the cached empty page must not be served again
+    assert [(change['id'], change['op']) for change in json.loads(changes_feed())['data']] == [(2, 'archive')]
+
+
+def test_only_one_active_client_allowed(test_db_with_data):
+    import sqlite3
+    with pytest.raises(sqlite3.IntegrityError):
+        test_db_with_data.clients.insert(nom='Second Active', active=True)
+    test_db_with_data.rollback()
+
+
+@patch('signCheckIn.controllers.request')
+def test_insert_commits_once(mock_req, test_db_with_data):
+    mock_req.json = {'nom': 'Single Commit', 'checkin': '2023-10-01', 'checkout': '2023-10-05'}
+
+    with patch.object(test_db_with_data, 'commit', wraps=test_db_with_data.commit) as commit:
+        insert()
+
+    assert commit.call_count == 1
+    active_clients = test_db_with_data(test_db_with_data.clients.active == True).select()
+    assert [c.nom for c in active_clients] == ['Single Commit']
+
+
+@patch('signCheckIn.controllers.request')
+def test_active_client_cached_until_insert(mock_req, test_db_with_data):
+    mock_req.query = {}
+    first = active_client()
+    del test_db_with_data._timings[:]
+
+    assert active_client() == first
+    assert test_db_with_data._timings == []
+
+    mock_req.json = {'nom': 'Cache Buster', 'checkin': '2023-10-01', 'checkout': '2023-10-05'}
+    insert()
+
+    assert json.loads(active_client())['data'][0]['nom'] == 'Cache Buster'
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_active_client_single_flight(mock_req, mock_resp, test_db_with_data):
+    mock_req.headers = {}
+    mock_req.query = {}
+    import threading
+    import time
+    import signCheckIn.controllers as controllers
+    calls = []
+    original_rows = controllers.active_client_rows
+
+    def slow_rows(*args):
+        calls.append(1)
+        time.sleep(0.1)
+        return original_rows(*args)
+
+    with patch.object(controllers, 'active_client_rows', slow_rows):
+        threads = [threading.Thread(target=active_client) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(calls) == 1
+
+
+def test_shared_generation_across_notifiers(tmp_path):
+    from signCheckIn.events import ChangeNotifier
+    # two notifiers on one file stand for two worker processes
+    path = str(tmp_path / 'clients.generation')
+    worker1 = ChangeNotifier(path, poll_interval=0.01)
+    worker2 = ChangeNotifier(path, poll_interval=0.01)
+    since = worker1.version
+
+    version = worker2.notify()
+
+    assert version != since
+    assert worker1.version == version
+    assert worker1.wait(since, timeout=1) == version
+    assert worker2.notify() == version + 1
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_active_client_not_modified(mock_req, mock_resp, test_db_with_data):
+    mock_req.headers = {}
+    mock_req.query = {}
+    mock_resp.headers = {}
+    active_client()
+    etag = mock_resp.headers['ETag']
+
+    mock_req.headers = {'If-None-Match': etag}
+    del test_db_with_data._timings[:]
+    with pytest.raises(HTTP) as not_modified:
+        active_client()
+    assert not_modified.value.status == 304
+    assert test_db_with_data._timings == []
+
+    mock_req.json = {'nom': 'New Version', 'checkin': '2023-10-01', 'checkout': '2023-10-05'}
+    insert()
+    response = json.loads(active_client())
+    assert response['data'][0]['nom'] == 'New Version'
+    assert mock_resp.headers['ETag'] != etag
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_list_etag_depends_on_page(mock_req, mock_resp, test_db_with_data):
+    mock_req.headers = {}
+    mock_resp.headers = {}
+    mock_req.query = {'limit': '1'}
+    first_page = json.loads(list_clients())
+    first_etag = mock_resp.headers['ETag']
+
+    mock_req.query = {'limit': '1', 'after': first_page['next']}
+    mock_req.headers = {'If-None-Match': f'W/{first_etag}'}
+    second_page = json.loads(list_clients())
+
+    assert mock_resp.headers['ETag'] != first_etag
+    assert second_page['data'][0]['nom'] == 'CLient1 Active'
+
+
+@patch('signCheckIn.controllers.request')
+def test_terminals_are_independent(mock_req, test_db_with_data):
+    mock_req.json = {'nom': 'Desk2 Client', 'terminal': 'desk2'}
+    insert()
+
+    # the default terminal keeps its active client
+    mock_req.query = {}
+    assert json.loads(active_client())['data'][0]['nom'] == 'CLient1 Active'
+    mock_req.query = {'terminal': 'desk2'}
+    assert json.loads(active_client())['data'][0]['nom'] == 'Desk2 Client'
+
+    mock_req.json = {'nom': 'Desk2 Next', 'terminal': 'desk2'}
+    insert()
+    actives = test_db_with_data(test_db_with_data.clients.active == True).select(orderby=test_db_with_data.clients.id)
+    assert [(c.nom, c.terminal) for c in actives] == [('CLient1 Active', 'default'), ('Desk2 Next', 'desk2')]
+
+    # modifying a desk2 client only deactivates desk2
+    desk2_client = test_db_with_data(test_db_with_data.clients.nom == 'Desk2 Client').select().first()
+    mock_req.json = {'nom': 'Desk2 Modified'}
+    modify(desk2_client.id)
+    actives = test_db_with_data(test_db_with_data.clients.active == True).select()
+    assert [c.nom for c in actives] == ['CLient1 Active']
+    assert test_db_with_data.clients[desk2_client.id].terminal == 'desk2'
+
+
+@patch('signCheckIn.controllers.request')
+def test_import_json_with_errors(mock_req, test_db_with_data):
+    mock_req.files = {}
+    mock_req.query = {'active': '2'}
+    mock_req.json = [
+        {'nom': 'Import1', 'checkin': '2024-03-01', 'checkout': '2024-03-02'},
+        {'nom': '', 'checkin': '2024-03-01'},
+        {'nom': 'Import3', 'email': 'i3@example.com', 'checkin': '2024-03-01', 'checkout': '2024-03-05'},
+        {'nom': 'Import4', 'checkin': '01/03/2024'},
+    ]
+
+    with patch.object(test_db_with_data, 'commit', wraps=test_db_with_data.commit) as commit:
+        response = import_clients()
+
+    assert commit.call_count == 1
+    assert response['inserted'] == 2
+    assert [e['row'] for e in response['errors']] == [1, 3]
+    assert 'nom' in response['errors'][0]['errors']
+    assert 'checkin' in response['errors'][1]['errors']
+    imported = test_db_with_data(test_db_with_data.clients.nom.startswith('Import')).select()
+    assert [c.nom for c in imported] == ['Import1', 'Import3']
+    assert imported[1].checkout == datetime(2024, 3, 5).date()
+    active_clients = test_db_with_data(test_db_with_data.clients.active == True).select()
+    assert [c.nom for c in active_clients] == ['Import3']
+
+
+@patch('signCheckIn.controllers.request')
+def test_import_csv_keeps_active_client(mock_req, test_db_with_data):
+    import io
+    upload = MagicMock()
+    upload.file = io.BytesIO(
+        "nom;email;checkin;checkout\nDupont;d@example.com;2024-03-01;2024-03-03\nMartin;;2024-03-02;2024-03-04\n".encode()
+    )
+    mock_req.files = {'file': upload}
+    mock_req.query = {}
+
+    response = import_clients()
+
+    assert response['inserted'] == 2
+    assert response['errors'] == []
+    assert test_db_with_data(test_db_with_data.clients.nom == 'Martin').count() == 1
+    active_clients = test_db_with_data(test_db_with_data.clients.active == True).select()
+    assert [c.nom for c in active_clients] == ['CLient1 Active']
+
+
+def test_ready(test_db):
+    response = ready()
+
+    assert response['status'] == 'ok'
+    assert response['db_ms'] >= 0
+
+
+@patch('signCheckIn.controllers.request')
+def test_archived_clients(mock_req, test_db):
+    test_db.clients_archive.insert(nom='Martin', checkout='2023-01-02', signed=True)
+    test_db.clients_archive.insert(nom='Durand', checkout='2023-02-02', signed=True)
+    test_db.commit()
+    mock_req.query = {'nom': 'mar'}
+
+    response = archived_clients()
+
+    assert [row['nom'] for row in response['data']] == ['Martin']
+    assert response['next'] is None
+
+    mock_req.query = {'checkout_from': 'hier'}
+    with pytest.raises(HTTPError) as excinfo:
+        archived_clients()
+    assert excinfo.value.status_code == 400
+
+
+@pytest.fixture
+def signature_store(tmp_path):
+    from signCheckIn.blobstore import BlobStore
+    with patch('signCheckIn.controllers.signatures', BlobStore(str(tmp_path))) as store:
+        yield store
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_asset_file_is_immutable_and_precompressed(mock_req, mock_resp, tmp_path):
+    import gzip
+    from signCheckIn.assets import Assets, build
+    (tmp_path / 'static' / 'js').mkdir(parents=True)
+    (tmp_path / 'static' / 'js' / 'app.js').write_text('console.log("kiosk");\n' * 100)
+    name = build(str(tmp_path / 'static'), str(tmp_path / 'build'))['js/app.js']
+    mock_resp.headers = {}
+    mock_req.headers = {'Accept-Encoding': 'gzip, br'}
+
+    with patch('signCheckIn.controllers.assets', Assets(str(tmp_path / 'build'))):
+        with asset_file(name) as stream:
+            assert gzip.decompress(stream.read()).startswith(b'console.log')
+        assert mock_resp.headers['Content-Encoding'] == 'gzip'
+        assert mock_resp.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+        assert mock_resp.headers['Content-Type'].startswith('text/javascript')
+
+        with pytest.raises(HTTPError) as excinfo:
+            asset_file('js/app.js')
+        assert excinfo.value.status_code == 404
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_sign_stores_digest_and_serves_file(mock_req, mock_resp, test_db_with_data, signature_store):
+    import io
+    from signCheckIn.blobstore import PNG_MAGIC
+    png = PNG_MAGIC + b'signature'
+    mock_req.environ = {'CONTENT_LENGTH': str(len(png)), 'wsgi.input': io.BytesIO(png)}
+    mock_resp.headers = {}
+    version = clients_changed.version
+
+    result = sign(2)
+
+    client = test_db_with_data.clients(2)
+    assert client.signed and client.signature == result['signature']
+    assert clients_changed.version != version
+
+    mock_req.headers = {}
+    with signature_file(result['signature']) as stream:
+        assert stream.read() == png
+    assert mock_resp.headers['Content-Type'] == 'image/png'
+    assert 'immutable' in mock_resp.headers['Cache-Control']
+    assert mock_resp.headers['Content-Security-Policy'].startswith('sandbox;')
+
+    mock_req.headers = {'If-None-Match': mock_resp.headers['ETag']}
+    with pytest.raises(HTTP) as excinfo:
+        signature_file(result['signature'])
+    assert excinfo.value.status == 304
+
+
+@patch('signCheckIn.controllers.request')
+def test_sign_rejects_bad_uploads(mock_req, test_db_with_data, signature_store):
+    import io
+    html = b'<html><svg></svg><script></script>'
+    cases = [
+        (1, {'CONTENT_LENGTH': '3', 'wsgi.input': io.BytesIO(b'GIF')}, 400),
+        # an HTML page carrying an <svg> is not an SVG document
+        (1, {'CONTENT_LENGTH': str(len(html)), 'wsgi.input': io.BytesIO(html)}, 400),
+        (1, {'wsgi.input': io.BytesIO(b'')}, 411),
+        (1, {'CONTENT_LENGTH': '0', 'wsgi.input': io.BytesIO(b'')}, 400),
+        (1, {'CONTENT_LENGTH': '-5', 'wsgi.input': io.BytesIO(b'')}, 400),
+        (1, {'CONTENT_LENGTH': str(10 ** 9), 'wsgi.input': io.BytesIO(b'')}, 413),
+        (999, {}, 404),
+    ]
+    for client_id, environ, status in cases:
+        mock_req.environ = environ
+        with pytest.raises(HTTPError) as excinfo:
+            sign(client_id)
+        assert excinfo.value.status_code == status
+    assert not test_db_with_data.clients(1).signed
+
+
+def test_metrics_text():
+    assert metrics_text().startswith('# HELP signcheckin_request_duration_seconds')
+
+
+@patch('signCheckIn.controllers.request')
+def test_wait_active_client_without_since(mock_req, test_db_with_data):
+    mock_req.query = {}
+
+    response = wait_active_client()
+
+    assert response['version'] == clients_changed.version
+    assert response['data'][0]['nom'] == 'CLient1 Active'
+
+
+@patch('signCheckIn.controllers.request')
+def test_wait_active_client_timeout(mock_req, test_db_with_data):
+    mock_req.query = {'since': str(clients_changed.version), 'timeout': '0.05'}
+
+    response = wait_active_client()
+
+    assert response['changed'] is False
+    assert 'data' not in response
+
+
+@patch('signCheckIn.controllers.request')
+def test_wait_active_client_rejects_invalid_timeouts(mock_req, test_db):
+    for timeout in ('nan', 'inf', '-inf', 'soon'):
+        mock_req.query = {'since': str(clients_changed.version), 'timeout': timeout}
+        with pytest.raises(HTTPError) as excinfo:
+            wait_active_client()
+        assert excinfo.value.status_code == 400
+
+    # a negative timeout is clamped to 0: the answer comes at once
+    mock_req.query = {'since': str(clients_changed.version), 'timeout': '-5'}
+    assert wait_active_client()['changed'] is False
+
+
+@patch('signCheckIn.controllers.request')
+def test_wait_active_client_woken_by_insert(mock_req, test_db):
+    import threading
+    since = clients_changed.version
+    mock_req.query = {'since': str(since), 'timeout': '5'}
+    result = {}
+    waiter = threading.Thread(target=lambda: result.update(wait_active_client()))
+    waiter.start()
+
+    mock_req.json = {'nom': 'Woken Client', 'checkin': '2023-10-01', 'checkout': '2023-10-05'}
+    insert()
+    waiter.join(timeout=5)
+
+    assert result['changed'] is True
+    assert result['version'] > since
+    assert result['data'][0]['nom'] == 'Woken Client'
+
+
+@patch('signCheckIn.controllers.response')
+@patch('signCheckIn.controllers.request')
+def test_woken_kiosks_share_the_active_client_read(mock_req, mock_resp, test_db_with_data):
+    import threading
+    import time
+    import signCheckIn.controllers as controllers
+    since = clients_changed.version
+    mock_req.headers = {}
+    mock_req.query = {'since': str(since), 'timeout': '5'}
+    results, calls = [], []
+    original_rows = controllers.active_client_rows
+
+    def slow_rows(*args):
+        calls.append(1)
+        time.sleep(0.1)
+        return original_rows(*args)
+
+    with patch.object(controllers, 'active_client_rows', slow_rows):
+        waiters = [threading.Thread(target=lambda: results.append(wait_active_client())) for _ in range(5)]
+        for waiter in waiters:
+            waiter.start()
+        clients_changed.notify()
+        # a kiosk polling active_client right after the change joins the same read
+        active_client()
+        for waiter in waiters:
+            waiter.join(timeout=5)
+
+    assert len(calls) == 1
+    assert [result['data'][0]['nom'] for result in results] == ['CLient1 Active'] * 5
+
 
 
 """
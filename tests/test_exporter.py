@@ -0,0 +1,47 @@
+import csv
+import datetime as dt
+import io
+
+import pytest
+
+from signCheckIn import exporter
+
+D = dt.date(2024, 7, 1)
+
+
+@pytest.fixture
+def db(db):
+    db.clients.insert(nom='Late', checkin='2024-07-03', cb='4970 1012 3456 7890')
+    db.clients.insert(nom='Outside', checkin='2024-08-01')
+    db.clients_archive.insert(id=100, nom='Archived', checkin='2024-07-02', signed=True, cb='12')
+    db.clients.insert(nom='Early', checkin='2024-07-01')
+    db.commit()
+    return db
+
+
+def read_csv(chunks):
+    return list(csv.DictReader(io.StringIO(''.join(chunks).removeprefix('\ufeff'))))
+
+
+def test_mask_card():
+    assert exporter.mask_card('4970 1012 3456 7890') == '************7890'
+    assert exporter.mask_card('12') == '**'
+    assert exporter.mask_card(None) == ''
+
+
+def test_stays_are_merged_in_checkin_order(db):
+    rows = list(exporter.stays(db, D, D + dt.timedelta(days=5), chunk_size=1))
+
+    assert [row['nom'] for row in rows] == ['Early', 'Archived', 'Late']
+    assert rows[2]['cb'] == '************7890'
+    assert rows[1]['signed'] is True
+
+
+def test_csv_is_written_in_chunks(db):
+    names = [field.name for field in exporter.export_fields(db.clients, 'omit')]
+    chunks = list(exporter.csv_chunks(exporter.stays(db, D, D + dt.timedelta(days=5), 'omit'), names, chunk_size=2))
+
+    assert len(chunks) == 2
+    rows = read_csv(chunks)
+    assert list(rows[0]) == list(names) and 'cb' not in rows[0]
+    assert [row['nom'] for row in rows] == ['Early', 'Archived', 'Late']
@@ -0,0 +1,90 @@
+from unittest.mock import patch
+
+import pytest
+from py4web import HTTP
+from py4web.core import action as real_action
+
+from signCheckIn.metrics import BUCKETS, Metrics
+
+
+def measured(metrics, func):
+    """Wrap func with the real fixture pipeline, as @action.uses does in production."""
+    return real_action.uses(metrics)(func)
+
+
+@patch('signCheckIn.metrics.request')
+def test_fixture_records_latency_rows_and_bytes(mock_req):
+    mock_req.environ = {}
+    mock_req.path = '/signCheckIn/list'
+    metrics = Metrics()
+
+    measured(metrics, lambda: dict(data=[1, 2, 3]))()
+    measured(metrics, lambda: '{"data": []}')()
+
+    stats = metrics.snapshot()['/signCheckIn/list']
+    assert stats.count == 2
+    assert stats.errors == 0
+    assert stats.rows == 3
+    assert stats.bytes == len('{"data": []}')
+    assert sum(stats.buckets) == 2
+
+
+@patch('signCheckIn.metrics.request')
+def test_fixture_counts_utf8_bytes(mock_req):
+    mock_req.environ = {}
+    mock_req.path = '/signCheckIn/list'
+    metrics = Metrics()
+
+    measured(metrics, lambda: '{"nom": "Hélène"}')()
+    measured(metrics, lambda: '{"nom": "Hélène"}'.encode())()
+
+    assert metrics.snapshot()['/signCheckIn/list'].bytes == 2 * len('{"nom": "Hélène"}'.encode())
+
+
+@patch('signCheckIn.metrics.request')
+def test_fixture_counts_errors(mock_req):
+    mock_req.environ = {}
+    mock_req.path = '/signCheckIn/modify/1'
+    metrics = Metrics()
+
+    def not_found():
+        raise HTTP(404)
+
+    with pytest.raises(HTTP):
+        measured(metrics, not_found)()
+
+    assert metrics.snapshot()['/signCheckIn/modify/1'].errors == 1
+
+
+def test_threads_add_to_the_same_counters():
+    import threading
+    metrics = Metrics()
+    # one short-lived thread per request, as a thread-per-request server runs them
+    threads = [
+        threading.Thread(target=lambda: [metrics.observe('insert', 0.002, rows=1) for _ in range(10)])
+        for _ in range(40)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = metrics.snapshot()
+    assert snapshot['insert'].count == snapshot['insert'].rows == 400
+    assert snapshot['insert'].buckets[BUCKETS.index(0.0025)] == 400
+    # nothing is kept per thread: the state is one set of counters per action
+    assert list(metrics._totals) == ['insert']
+
+
+def test_render_prometheus_text():
+    metrics = Metrics()
+    metrics.observe('active_client', 0.003, rows=1, size=120)
+    metrics.observe('active_client', 2.0, error=True)
+
+    text = metrics.render()
+
+    assert 'signcheckin_request_duration_seconds_bucket{action="active_client",le="0.005"} 1' in text
+    assert 'signcheckin_request_duration_seconds_bucket{action="active_client",le="+Inf"} 2' in text
+    assert 'signcheckin_request_duration_seconds_count{action="active_client"} 2' in text
+    assert 'signcheckin_request_errors_total{action="active_client"} 1' in text
+    assert 'signcheckin_response_bytes_total{action="active_client"} 120' in text
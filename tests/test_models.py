@@ -0,0 +1,25 @@
+from pydal import DAL
+
+from signCheckIn.models import define_tables, schema_fingerprint, schema_is_current, store_fingerprint
+
+
+def test_fingerprint_is_stable():
+    assert schema_fingerprint() == schema_fingerprint() > 0
+
+
+def test_fingerprint_is_stored_in_the_database(tmp_path):
+    db = DAL('sqlite://storage.db', folder=str(tmp_path))
+    fingerprint = schema_fingerprint()
+    assert not schema_is_current(db, fingerprint)
+
+    define_tables(db)
+    store_fingerprint(db, fingerprint)
+    db.commit()
+    db.close()
+
+    # a new connection (a new worker) sees it, a recreated file does not
+    db = DAL('sqlite://storage.db', folder=str(tmp_path))
+    assert schema_is_current(db, fingerprint)
+    assert not schema_is_current(db, fingerprint + 1)
+    db.close()
+    assert not schema_is_current(DAL('sqlite:memory'), fingerprint)
@@ -0,0 +1,81 @@
+import datetime as dt
+
+from pydal import DAL
+
+from signCheckIn import occupancy
+from signCheckIn.models import define_tables
+
+D = dt.date(2024, 7, 1)
+
+
+def test_stay_deltas_counts_nights_in_house():
+    deltas = occupancy.stay_deltas(dict(checkin='2024-07-01', checkout='2024-07-03', signed=True))
+
+    assert deltas[D] == dict(arrivals=1, departures=0, signed=1, unsigned=0, in_house=1)
+    assert deltas[D + dt.timedelta(days=1)]['in_house'] == 1
+    assert deltas[D + dt.timedelta(days=2)] == dict(arrivals=0, departures=1, signed=0, unsigned=0, in_house=0)
+
+
+def test_record_moves_a_modified_stay(db):
+    before = dict(checkin=D, checkout=D + dt.timedelta(days=1), signed=False)
+    occupancy.record(db, after=before)
+    occupancy.record(db, before=before, after=dict(before, checkin=D + dt.timedelta(days=1),
+                                                   checkout=D + dt.timedelta(days=2)))
+    occupancy.record(db, after=dict(checkin='', checkout='not a date'))
+
+    days = occupancy.read(db, D, D + dt.timedelta(days=2))
+
+    assert [day['arrivals'] for day in days] == [0, 1, 0]
+    assert [day['in_house'] for day in days] == [0, 1, 0]
+    assert [day['departures'] for day in days] == [0, 0, 1]
+    assert days[0] == dict(day='2024-07-01', arrivals=0, departures=0, signed=0, unsigned=0, in_house=0)
+
+
+def test_rebuild_matches_incremental_counts(db):
+    for offset in range(30):
+        stay = dict(checkin=D + dt.timedelta(days=offset % 7),
+                    checkout=D + dt.timedelta(days=offset % 7 + 1 + offset % 3), signed=offset % 2 == 0)
+        table = db.clients if offset % 4 else db.clients_archive
+        table.insert(nom=f'Client {offset}', **stay)
+        occupancy.record(db, after=stay)
+    db.commit()
+    incremental = occupancy.read(db, D, D + dt.timedelta(days=10))
+
+    db(db.daily_stats).delete()
+    assert occupancy.rebuild(db, batch_size=7) == 30
+
+    assert occupancy.read(db, D, D + dt.timedelta(days=10)) == incremental
+    assert sum(day['arrivals'] for day in incremental) == 30
+
+
+def test_rebuild_keeps_writes_made_while_reading(tmp_path, monkeypatch):
+    db = DAL('sqlite://stats.db', folder=str(tmp_path))
+    define_tables(db)
+    db.executesql('PRAGMA journal_mode=WAL;')
+    writer = DAL('sqlite://stats.db', folder=str(tmp_path), driver_args=dict(timeout=0))
+    define_tables(writer, migrate=False)
+    db.clients.insert(nom='A', checkin=D, checkout=D + dt.timedelta(days=1))
+    db.commit()
+    version = occupancy.clients_changed.version
+    stay_deltas = occupancy.stay_deltas
+    written = []
+
+    def write_while_reading(*args):
+        # a check-in committed between the read of the stays and the update
+        if not written:
+            written.append(1)
+            stay = dict(checkin=D, checkout=D + dt.timedelta(days=2), signed=True)
+            writer.clients.insert(nom='B', **stay)
+            occupancy.record(writer, after=stay)
+            writer.commit()
+        return stay_deltas(*args)
+
+    monkeypatch.setattr(occupancy, 'stay_deltas', write_while_reading)
+    # the writer never waits: timeout=0 would raise "database is locked"
+    assert occupancy.rebuild(db) == 1
+
+    day = occupancy.read(db, D, D)[0]
+    assert (day['arrivals'], day['signed'], day['unsigned'], day['in_house']) == (2, 1, 1, 2)
+    assert occupancy.clients_changed.version == version + 1
+    writer.close()
+    db.close()
@@ -0,0 +1,68 @@
+import pytest
+from loguru import logger
+from py4web import response
+from py4web.core import action as real_action
+from pydal import DAL, Field
+
+from signCheckIn.profiling import SQLProfiler, redact
+
+
+@pytest.fixture
+def db():
+    db = DAL('sqlite:memory')
+    db.define_table('clients', Field('nom'), Field('cb'))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def warnings():
+    messages = []
+    sink = logger.add(messages.append, level='WARNING', format='{message}')
+    yield messages
+    logger.remove(sink)
+
+
+def test_redact_hides_literals():
+    sql = "SELECT * FROM clients WHERE (cb = '4970 1234 ''x''') AND (id > 42);"
+    assert redact(sql) == "SELECT * FROM clients WHERE (cb = ?) AND (id > ?);"
+
+
+def test_statements_are_timed_and_counted(db):
+    profiler = SQLProfiler(db, slow_query_ms=1000)
+    captured = {}
+
+    def handler():
+        db.clients.insert(nom='A')
+        db.clients.insert(nom='B')
+        db(db.clients.nom == 'A').update(cb='x')
+        db(db.clients).select()
+        db.executesql('SELECT nom FROM clients;')
+        captured['statements'] = profiler.statements()
+        return 'ok'
+
+    real_action.uses(profiler)(handler)()
+
+    statements = captured['statements']
+    assert [rows for _, _, rows in statements] == [1, 1, 1, 2, 2]
+    assert all(duration >= 0 for _, duration, _ in statements)
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+    assert '5 queries' in response.headers['Server-Timing']
+
+
+def test_slow_queries_are_logged_redacted(db, warnings):
+    SQLProfiler(db, slow_query_ms=0)
+    db.clients.insert(nom='Dupont', cb='4970 0000 0000 0000')
+    db(db.clients.cb == '4970 0000 0000 0000').select()
+
+    assert len(warnings) == 2
+    assert all('4970' not in message and 'Dupont' not in message for message in warnings)
+    assert 'Slow query' in warnings[1] and '1 rows' in warnings[1]
+
+
+def test_fast_queries_are_not_logged(db, warnings):
+    SQLProfiler(db, slow_query_ms=1000)
+    db.clients.insert(nom='A')
+    db(db.clients).select()
+
+    assert warnings == []
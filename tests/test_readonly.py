@@ -0,0 +1,67 @@
+import sqlite3
+
+import pytest
+from py4web.core import action as real_action
+from pydal import DAL, Field
+
+from signCheckIn import settings
+from signCheckIn.common import sqlite_pragmas
+from signCheckIn.readonly import ReadOnlyDAL
+
+
+@pytest.fixture
+def dbs(tmp_path):
+    writer = DAL('sqlite://storage.db', folder=str(tmp_path),
+                 after_connection=sqlite_pragmas(settings.SQLITE_PRAGMAS))
+    writer.define_table('clients', Field('nom'))
+    writer.clients.insert(nom='Committed')
+    writer.commit()
+    reader = ReadOnlyDAL('sqlite://storage.db', folder=str(tmp_path), pool_size=2, migrate=False,
+                         after_connection=sqlite_pragmas(settings.SQLITE_READ_PRAGMAS))
+    reader.define_table('clients', Field('nom'))
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def test_reader_refuses_writes(dbs):
+    _, reader = dbs
+    with pytest.raises(sqlite3.OperationalError, match='readonly'):
+        reader.clients.insert(nom='Nope')
+
+
+def test_reader_does_not_wait_for_the_writer(dbs):
+    writer, reader = dbs
+    writer.clients.insert(nom='Pending')  # write transaction left open
+
+    assert [row.nom for row in reader(reader.clients).select()] == ['Committed']
+    writer.commit()
+    assert reader(reader.clients).count() == 2
+
+
+def test_fixture_recycles_after_the_stream_ends(dbs):
+    _, reader = dbs
+    pools, uri = reader._adapter.POOLS, reader._adapter.uri
+
+    def stream():
+        def rows():
+            yield from (row.nom for row in reader(reader.clients).select())
+        return rows()
+
+    output = real_action.uses(reader)(stream)()
+
+    assert not pools.get(uri)  # the stream still holds the connection
+    assert list(output) == ['Committed']
+    assert len(pools[uri]) == 1
+
+
+def test_pooling_override_is_sqlite_only(tmp_path):
+    from unittest.mock import patch
+    from pydal.adapters.sqlite import SQLite
+
+    # other engines have no dbpath and keep pydal's own pooling
+    with patch.object(SQLite, 'dbengine', 'postgres'):
+        reader = ReadOnlyDAL('sqlite://storage.db', folder=str(tmp_path), pool_size=2)
+    assert reader._adapter.uri == 'sqlite://storage.db'
+    assert reader._adapter.pool_size == 0
+    reader.close()
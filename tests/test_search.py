@@ -0,0 +1,67 @@
+import datetime as dt
+
+import pytest
+from pydal import DAL
+
+from signCheckIn import archive, search
+from signCheckIn.models import create_indexes, define_tables
+
+
+@pytest.fixture
+def db(db):
+    db.clients.insert(nom='Hélène Lefèvre', email='helene.lefevre@example.fr', telephone='06 12 34 56 78')
+    db.clients.insert(nom='Jean Dupont', email='jdupont@example.com', telephone='+33 7 98 76 54 32')
+    db.commit()
+    return db
+
+
+def names(db, text):
+    return [row['nom'] for row in search.search_rows(db, text, 10)]
+
+
+def test_prefix_and_accent_insensitive(db):
+    assert names(db, 'helene') == ['Hélène Lefèvre']
+    assert names(db, 'LEFÈ') == ['Hélène Lefèvre']
+    assert names(db, 'dup jean') == ['Jean Dupont']
+    assert names(db, 'jdupont@example') == ['Jean Dupont']
+    assert names(db, 'dupont hélène') == []
+
+
+def test_phone_digits_are_normalized(db):
+    assert names(db, '0612') == ['Hélène Lefèvre']
+    assert names(db, '06.12.34') == ['Hélène Lefèvre']
+    assert names(db, '07 98 76') == ['Jean Dupont']
+    assert names(db, '+33798') == ['Jean Dupont']
+
+
+def test_operators_are_plain_text(db):
+    assert names(db, 'NOT "dupont') == []
+    assert names(db, '') == []
+
+
+def test_index_follows_updates_and_archival(db):
+    db(db.clients.nom == 'Jean Dupont').update(nom='Jean Durand')
+    db.commit()
+    assert names(db, 'dupont') == []
+    assert names(db, 'durand') == ['Jean Durand']
+
+    db(db.clients.nom == 'Jean Durand').update(signed=True, checkout=dt.date(2020, 1, 1))
+    archive.archive_clients(db, before=dt.date(2024, 1, 1), pause=0)
+    rows = search.search_rows(db, 'durand', 10)
+    assert [(row['nom'], row['archived']) for row in rows] == [('Jean Durand', True)]
+
+    db(db.clients_archive).delete()
+    db(db.clients).delete()
+    assert names(db, 'durand') == [] and names(db, 'helene') == []
+
+
+def test_existing_rows_are_backfilled():
+    db = DAL('sqlite:memory')
+    define_tables(db)
+    db.clients.insert(nom='Ancien Client')
+    db.commit()
+
+    create_indexes(db)
+
+    assert names(db, 'ancien') == ['Ancien Client']
+    db.close()
@@ -0,0 +1,69 @@
+import datetime as dt
+import json
+from unittest.mock import patch
+
+import pytest
+from pydal import DAL, Field
+
+from signCheckIn import serializers
+
+
+def test_select_plain_matches_rows_as_dict():
+    db = DAL('sqlite:memory')
+    db.define_table('clients', Field('nom'), Field('checkin', 'date'),
+                    Field('signed', 'boolean'), Field('created_on', 'datetime'))
+    db.clients.insert(nom='Élise', checkin=dt.date(2024, 1, 2), signed=True,
+                      created_on=dt.datetime(2024, 1, 1, 10, 30))
+    db.clients.insert(nom='Nul')
+
+    plain = serializers.select_plain(db, db.clients.id > 0, list(db.clients), orderby=db.clients.id)
+
+    assert plain == [
+        dict(id=1, nom='Élise', checkin='2024-01-02', signed=True, created_on='2024-01-01 10:30:00'),
+        dict(id=2, nom='Nul', checkin=None, signed=None, created_on=None),
+    ]
+    db.close()
+
+
+def test_plain_rows_converts_driver_objects():
+    db = DAL('sqlite:memory')
+    db.define_table('t', Field('day', 'date'), Field('flag', 'boolean'))
+
+    assert serializers.plain_rows(list(db.t), [(1, dt.date(2024, 5, 1), 1)]) == [
+        dict(id=1, day='2024-05-01', flag=True)
+    ]
+    db.close()
+
+
+def test_json_dumps_falls_back_to_stdlib():
+    payload = dict(data=[dict(nom='Élise', signed=True)])
+
+    with patch.object(serializers, 'orjson', None):
+        fallback = serializers.json_dumps(payload)
+
+    assert json.loads(fallback) == json.loads(serializers.json_dumps(payload)) == payload
+
+
+def test_columnar_sends_names_once():
+    rows = [dict(id=1, nom='A'), dict(id=2, nom='B')]
+
+    assert serializers.columnar(rows) == dict(fields=['id', 'nom'], rows=[[1, 'A'], [2, 'B']])
+    assert serializers.columnar([]) == dict(fields=[], rows=[])
+
+
+def test_compress_above_threshold_only():
+    import gzip
+    body = json.dumps(dict(data=[dict(nom='Client')] * 100))
+
+    compressed, encoding = serializers.compress(body, 'gzip', min_bytes=1024)
+    assert encoding == 'gzip' and gzip.decompress(compressed).decode() == body
+    assert serializers.compress('{}', 'gzip', min_bytes=1024) == ('{}', 'identity')
+    assert serializers.compress(body, 'identity') == (body, 'identity')
+
+
+def test_msgpack_dumps():
+    msgpack = pytest.importorskip('msgpack')
+
+    payload = dict(data=[dict(nom='Élise', signed=True)])
+
+    assert msgpack.unpackb(serializers.msgpack_dumps(payload)) == payload